@@ -1,5 +1,7 @@
 """Julia set generator without optional PIL-based image drawing"""
 from functools import wraps
+from itertools import islice
+from numbers import Number
 from timeit import default_timer as timer
 import numpy as np
 # area of complex space to investigate
@@ -38,49 +40,56 @@ def timefn(fn):
     return measure_time
 
 
+def axis_coords(start, stop, step):
+    """Yield start, start + step, ... up to (not including) stop, accumulated like
+    the original while loops so the coordinates are bitwise the same"""
+    coord = start
+    while (coord < stop) if step > 0 else (coord > stop):
+        yield coord
+        coord += step
+
+
+def iter_row_tiles(desired_width, rows_per_tile):
+    """Yield the complex coordinates (zs) of consecutive tiles of at most
+    rows_per_tile rows in row major order, one tile is kept in memory at a time"""
+    x = list(axis_coords(x1, x2, (x2 - x1) / desired_width))
+    y = axis_coords(y2, y1, (y1 - y2) / desired_width)
+    while True:
+        ys = list(islice(y, rows_per_tile))
+        if not ys:
+            return
+        yield [complex(xcoord, ycoord) for ycoord in ys for xcoord in x]
+
+
 #@profile
 @timefn
-def calc_pure_python(desired_width, max_iterations):
-    """Create a list of complex coordinates (zs) and complex parameters (cs),
-    build Julia set"""
-    x_step = (x2 - x1) / desired_width
-    y_step = (y1 - y2) / desired_width
-    x = []
-    y = []
-    ycoord = y2
-    while ycoord > y1:
-        y.append(ycoord)
-        ycoord += y_step
-    xcoord = x1
-    while xcoord < x2:
-        x.append(xcoord)
-        xcoord += x_step
-    # build a list of coordinates and the initial condition for each cell.
-    # Note that our initial condition is a constant and could easily be removed,
-    # we use it to simulate a real-world scenario with several inputs to our
-    # function
-    zs = []
-    cs = []
-    for ycoord in y:
-        for xcoord in x:
-            zs.append(complex(xcoord, ycoord))
-            cs.append(complex(c_real, c_imag))
-
-    print("Length of x:", len(x))
-    print("Total elements:", len(zs))
-    output = calculate_z_serial_purepython(max_iterations, zs, cs)
+def calc_pure_python(desired_width, max_iterations, backend="python", rows_per_tile=64):
+    """Build Julia set using the kernel given by backend (see backends). The
+    complex coordinates (zs) are generated tile by tile and the parameter c is a
+    scalar, so no list of one element per grid point is ever built"""
+    c = complex(c_real, c_imag)
+    print("Length of x:", sum(1 for _ in axis_coords(x1, x2, (x2 - x1) / desired_width)))
+    output_sum = 0
+    n_elements = 0
+    for zs in iter_row_tiles(desired_width, rows_per_tile):
+        n_elements += len(zs)
+        output_sum += sum(backends[backend](max_iterations, zs, c))
+    print("Total elements:", n_elements)
     # This sum is expected for a 1000^2 grid with 300 iterations
     # It ensures that our code evolves exactly as we'd intended
-    assert sum(output) == 33219980
+    if desired_width == 1000 and max_iterations == 300:
+        assert output_sum == 33219980
 
 
 def calculate_z_serial_purepython(maxiter, zs, cs):
-    """Calculate output list using Julia update rule"""
+    """Calculate output list using Julia update rule, cs is either a list with one
+    parameter per coordinate or a single complex constant"""
     output = [0] * len(zs)
+    scalar_c = isinstance(cs, Number)
     for i in range(len(zs)):
         n = 0
         z = zs[i]
-        c = cs[i]
+        c = cs if scalar_c else cs[i]
         while abs(z) < 2 and n < maxiter:
             z = z * z + c
             n += 1
@@ -88,6 +97,38 @@ def calculate_z_serial_purepython(maxiter, zs, cs):
     return output
 
 
+def calculate_z_numpy(maxiter, zs, cs):
+    """Calculate output array using Julia update rule, vectorised with numpy.
+    All points are iterated at once, escaped points are masked out so they
+    do no further work. Gives the same result as calculate_z_serial_purepython,
+    cs is a list or a single complex constant"""
+    z = np.array(zs, dtype=np.complex128)
+    c = np.array(cs, dtype=np.complex128)
+    scalar_c = c.ndim == 0
+    output = np.zeros(z.shape, dtype=np.int64)
+    idx = np.arange(z.size)
+    for n in range(maxiter):
+        # drop the points that have escaped, abs() matches the python version bitwise
+        active = np.abs(z) < 2
+        if not active.all():
+            idx = idx[active]
+            z = z[active]
+            if not scalar_c:
+                c = c[active]
+        if idx.size == 0:
+            break
+        z = z * z + c
+        output[idx] += 1
+    return output
+
+
+# selectable Julia set kernels, all take (maxiter, zs, cs)
+backends = {
+    "python": calculate_z_serial_purepython,
+    "numpy": calculate_z_numpy,
+}
+
+
 if __name__ == "__main__":
     # Calculate the Julia set using a pure Python solution with
     # reasonable defaults for a laptop
@@ -6,7 +6,6 @@ import numpy
 import numpy as np
 from timeit import default_timer as timer
 import time
-import matplotlib.pyplot as plt
 """
 Note that default_timer is time.perf_counter()
 whilst perf_counter_ns() exists which returns an int instead
@@ -44,6 +43,7 @@ def checktick_float(timer_function):
 
 
 if __name__ == '__main__':
+    import matplotlib.pyplot as plt
     N = 1000
     timings = [[], [], [], [], []]
     labels = ['time.time_ns', 'time.time', 'time.perf_counter_ns', 'time.perf_counter', 'timeit.default_timer']
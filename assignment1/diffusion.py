@@ -2,9 +2,18 @@
 Author: Johan Ericsson
 Date: 2022-01-31
 """
+import numpy as np
 
 grid_shape = (640, 640)
 
+# profile is only defined when running under kernprof
+try:
+    profile
+except NameError:
+    def profile(fn):
+        return fn
+
+
 @profile
 def evolve(grid, dt, D=1.0):
     xmax, ymax = grid_shape
@@ -20,23 +29,160 @@ def evolve(grid, dt, D=1.0):
             new_grid[i][j] = grid[i][j] + D * (grid_xx + grid_yy) * dt
     return new_grid
 
+
 @profile
-def run_experiment(num_iterations):
-    # Setting up initial conditions
-    xmax, ymax = grid_shape
-    grid = [[0.0] * ymax for x in range(xmax)]
+def evolve_numpy(grid, new_grid, work, dt, D=1.0):
+    """
+    Same periodic 5-point stencil as evolve on numpy arrays. The result is written
+    into the preallocated new_grid and work = (xx, yy) are two preallocated arrays
+    of the grid's shape, the periodic neighbours are taken with slices (the edges
+    separately) so nothing is allocated. The operations are done in the same order
+    as in evolve so the result is bitwise the same.
+    """
+    return evolve_strip(grid, new_grid, work, 0, grid.shape[0], dt, D)
+
+
+def evolve_strip(grid, new_grid, work, r0, r1, dt, D=1.0):
+    """evolve_numpy for the rows r0, ..., r1 - 1 of the grid only, work = (xx, yy)
+    are preallocated arrays of the strip's shape (r1 - r0, columns)"""
+    xmax = grid.shape[0]
+    xx, yy = work
+    g = grid[r0:r1]
+    new = new_grid[r0:r1]
+    # grid_xx = grid[i+1] + grid[i-1] - 2 grid, first and last row of the strip wrap around
+    if r1 - r0 > 2:
+        np.add(grid[r0 + 2:r1], grid[r0:r1 - 2], out=xx[1:-1])
+    np.add(grid[(r0 + 1) % xmax], grid[(r0 - 1) % xmax], out=xx[0])
+    if r1 - r0 > 1:
+        np.add(grid[r1 % xmax], grid[r1 - 2], out=xx[-1])
+    np.multiply(2.0, g, out=yy)
+    np.subtract(xx, yy, out=xx)
+    # grid_yy = grid[j+1] + grid[j-1] - 2 grid, new holds the neighbour sum
+    np.add(g[:, 2:], g[:, :-2], out=new[:, 1:-1])
+    np.add(g[:, 1], g[:, -1], out=new[:, 0])
+    np.add(g[:, 0], g[:, -2], out=new[:, -1])
+    np.subtract(new, yy, out=yy)
+    # new_grid = grid + D * (grid_xx + grid_yy) * dt
+    np.add(xx, yy, out=xx)
+    np.multiply(D, xx, out=xx)
+    np.multiply(xx, dt, out=xx)
+    np.add(g, xx, out=new)
+    return new_grid
+
+
+def _wrapped_segments(start, length, n):
+    """Split the periodic index range start, ..., start + length - 1 of an axis of
+    length n into (source, destination, length) pieces that need no wrap"""
+    segments = []
+    dst = 0
+    while dst < length:
+        src = (start + dst) % n
+        m = min(length - dst, n - src)
+        segments.append((src, dst, m))
+        dst += m
+    return segments
+
+
+def _evolve_interior(old, new, xx, yy, dt, D):
+    """One step of the evolve_numpy stencil on the interior old[1:-1, 1:-1] without
+    wrap around, the result goes into new[1:-1, 1:-1]"""
+    centre = old[1:-1, 1:-1]
+    out = new[1:-1, 1:-1]
+    np.add(old[2:, 1:-1], old[:-2, 1:-1], out=xx)
+    np.multiply(2.0, centre, out=yy)
+    np.subtract(xx, yy, out=xx)
+    np.add(old[1:-1, 2:], old[1:-1, :-2], out=out)
+    np.subtract(out, yy, out=yy)
+    np.add(xx, yy, out=xx)
+    np.multiply(D, xx, out=xx)
+    np.multiply(xx, dt, out=xx)
+    np.add(centre, xx, out=out)
 
+
+@profile
+def evolve_blocked(grid, new_grid, steps, dt, D=1.0, tile=None):
+    """
+    Temporally blocked evolve_numpy, advances grid by steps time steps into new_grid.
+    The grid is cut into tiles, every tile is copied together with a periodic halo
+    of width steps into a small buffer and advanced steps time steps there while
+    it is in cache, the valid region shrinks by one cell per step and after the
+    last step it is exactly the tile. The grid is streamed through main memory
+    once per steps time steps instead of once per step, and the stencil does the
+    same operations as evolve_numpy so the result is bitwise the same.
+    tile = (rows, columns), by default strips of 32 full rows: with numpy the per
+    call overhead makes a few long contiguous strips faster than square tiles.
+    """
+    xmax, ymax = grid.shape
+    if tile is None:
+        tile = (32, ymax)
+    k = steps
+    shape = (tile[0] + 2 * k, tile[1] + 2 * k)
+    buffers = [np.empty(shape), np.empty(shape)]
+    xx = np.empty((shape[0] - 2, shape[1] - 2))
+    yy = np.empty((shape[0] - 2, shape[1] - 2))
+    for i0 in range(0, xmax, tile[0]):
+        for j0 in range(0, ymax, tile[1]):
+            h = min(tile[0], xmax - i0) + 2 * k
+            w = min(tile[1], ymax - j0) + 2 * k
+            old = buffers[0][:h, :w]
+            new = buffers[1][:h, :w]
+            # tile and halo, wrapped around the periodic boundaries
+            for src_i, dst_i, m_i in _wrapped_segments(i0 - k, h, xmax):
+                for src_j, dst_j, m_j in _wrapped_segments(j0 - k, w, ymax):
+                    old[dst_i:dst_i + m_i, dst_j:dst_j + m_j] = grid[src_i:src_i + m_i, src_j:src_j + m_j]
+            for s in range(k):
+                # only the cells that are still valid after this step are computed
+                o = old[s:h - s, s:w - s]
+                n = new[s:h - s, s:w - s]
+                _evolve_interior(o, n, xx[:h - 2 - 2 * s, :w - 2 - 2 * s], yy[:h - 2 - 2 * s, :w - 2 - 2 * s], dt, D)
+                old, new = new, old
+            new_grid[i0:i0 + h - 2 * k, j0:j0 + w - 2 * k] = old[k:h - k, k:w - k]
+    return new_grid
+
+
+def set_initial_conditions(grid, shape):
     # These initial conditions are simulating a drop of dye in the middle of our
     # simulated region
-    block_low = int(grid_shape[0] * 0.4)
-    block_high = int(grid_shape[0] * 0.5)
+    block_low = int(shape[0] * 0.4)
+    block_high = int(shape[0] * 0.5)
     for i in range(block_low, block_high):
-        for j in range(block_low, block_high):
+        for j in range(int(shape[1] * 0.4), int(shape[1] * 0.5)):
             grid[i][j] = 0.005
 
+
+@profile
+def run_experiment(num_iterations, backend="list", steps_per_block=8):
+    """Evolve the dye drop num_iterations steps, backend is "list" (evolve),
+    "numpy" (evolve_numpy with ping-pong buffers) or "blocked" (evolve_blocked,
+    steps_per_block steps per sweep over the grid), returns the final grid"""
+    # Setting up initial conditions
+    xmax, ymax = grid_shape
+    if backend == "list":
+        grid = [[0.0] * ymax for x in range(xmax)]
+    elif backend in ("numpy", "blocked"):
+        grid = np.zeros(grid_shape)
+    else:
+        raise ValueError(f"unknown backend {backend}")
+
+    set_initial_conditions(grid, grid_shape)
+
     # Evolve the initial conditions
-    for i in range(num_iterations):
-        grid = evolve(grid, 0.1)
+    if backend == "list":
+        for i in range(num_iterations):
+            grid = evolve(grid, 0.1)
+    elif backend == "numpy":
+        # all buffers are allocated once, the grids swap roles every step
+        new_grid = np.empty(grid_shape)
+        work = (np.empty(grid_shape), np.empty(grid_shape))
+        for i in range(num_iterations):
+            evolve_numpy(grid, new_grid, work, 0.1)
+            grid, new_grid = new_grid, grid
+    else:
+        new_grid = np.empty(grid_shape)
+        for i in range(0, num_iterations, steps_per_block):
+            evolve_blocked(grid, new_grid, min(steps_per_block, num_iterations - i), 0.1)
+            grid, new_grid = new_grid, grid
+    return grid
 
 
 if __name__ == '__main__':
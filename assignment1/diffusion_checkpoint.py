@@ -0,0 +1,147 @@
+"""
+Checkpoint/restart for long diffusion runs.
+Snapshots of the grid are written as memory mapped .npy files by a background
+thread. The compute loop only copies the grid into one of a few preallocated
+buffers and goes on, it never waits for the disk. A run can be resumed from
+the latest snapshot in the checkpoint directory.
+"""
+import argparse
+import os
+import re
+import threading
+from queue import Queue
+from time import perf_counter as timer
+import numpy as np
+from diffusion import evolve_numpy, grid_shape, set_initial_conditions
+
+SNAPSHOT_NAME = "step_{:09d}.npy"
+SNAPSHOT_PATTERN = re.compile(r"step_(\d{9})\.npy$")
+
+
+class SnapshotWriter:
+    """
+    Background writer of grid snapshots. submit() copies the grid into a free
+    buffer and queues it, if all n_buffers buffers are still waiting to be written
+    the snapshot is skipped (and counted) rather than blocking the caller, unless
+    wait is set. An error of the writer is raised by the next submit() or close().
+    """
+    def __init__(self, directory, shape, n_buffers=2):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.written = 0
+        self.skipped = 0
+        self.error = None
+        self._free = Queue()
+        for _ in range(n_buffers):
+            self._free.put(np.empty(shape))
+        self._pending = Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def submit(self, step, grid, wait=False):
+        self._raise_error()
+        if not wait and self._free.empty():
+            self.skipped += 1
+            return False
+        buffer = self._free.get()
+        np.copyto(buffer, grid)
+        self._pending.put((step, buffer))
+        return True
+
+    def _write(self, step, buffer):
+        path = os.path.join(self.directory, SNAPSHOT_NAME.format(step))
+        # written under a temporary name and renamed, a crash never leaves a partial snapshot behind
+        tmp_path = path + ".tmp"
+        snapshot = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=buffer.dtype, shape=buffer.shape)
+        snapshot[:] = buffer
+        snapshot.flush()
+        del snapshot
+        os.replace(tmp_path, path)
+
+    def _run(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+            step, buffer = item
+            try:
+                # after an error the remaining snapshots are dropped
+                if self.error is None:
+                    self._write(step, buffer)
+                    self.written += 1
+            except Exception as e:
+                self.error = e
+            finally:
+                # the buffer always goes back, a submit waiting for one must not block forever
+                self._free.put(buffer)
+
+    def close(self):
+        """Wait until all queued snapshots are on disk"""
+        self._pending.put(None)
+        self._thread.join()
+        self._raise_error()
+
+
+def latest_checkpoint(directory, max_step=None):
+    """(step, path) of the newest snapshot in directory, at or before max_step if
+    given, or None if there is none"""
+    if not os.path.isdir(directory):
+        return None
+    steps = [int(m.group(1)) for m in map(SNAPSHOT_PATTERN.match, os.listdir(directory))
+             if m and (max_step is None or int(m.group(1)) <= max_step)]
+    if not steps:
+        return None
+    step = max(steps)
+    return step, os.path.join(directory, SNAPSHOT_NAME.format(step))
+
+
+def run_checkpointed(num_iterations, directory, interval=100, resume=True, shape=grid_shape, dt=0.1):
+    """
+    run_experiment with the numpy backend, a snapshot is written every interval steps
+    and after the last one. With resume the run continues from the latest snapshot
+    in directory at or before num_iterations instead of step 0. Returns the final grid.
+    """
+    grid = np.zeros(shape)
+    start = 0
+    # snapshots of a longer earlier run are past the end of this one
+    checkpoint = latest_checkpoint(directory, num_iterations) if resume else None
+    if checkpoint is not None:
+        start, path = checkpoint
+        np.copyto(grid, np.load(path, mmap_mode="r"))
+        print(f"resuming from step {start} ({path})")
+    else:
+        set_initial_conditions(grid, shape)
+
+    new_grid = np.empty(shape)
+    work = (np.empty(shape), np.empty(shape))
+    writer = SnapshotWriter(directory, shape)
+    try:
+        for step in range(start, num_iterations):
+            evolve_numpy(grid, new_grid, work, dt)
+            grid, new_grid = new_grid, grid
+            if step + 1 == num_iterations:
+                # the final state is always kept
+                writer.submit(step + 1, grid, wait=True)
+            elif (step + 1) % interval == 0:
+                writer.submit(step + 1, grid)
+    finally:
+        writer.close()
+    if writer.skipped:
+        print(f"{writer.skipped} snapshots skipped, the writer could not keep up")
+    return grid
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Diffusion run with checkpoint/restart")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--interval", type=int, default=100, help="steps between snapshots")
+    parser.add_argument("--directory", default="checkpoints")
+    parser.add_argument("--no-resume", dest="resume", action="store_false")
+    args = parser.parse_args()
+    t0 = timer()
+    run_checkpointed(args.iterations, args.directory, args.interval, args.resume)
+    print(f"took {timer() - t0} seconds")
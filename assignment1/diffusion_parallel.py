@@ -0,0 +1,132 @@
+"""
+Domain decomposed diffusion solver.
+The grid is split into strips of rows, each strip is owned by one worker process.
+Both ping-pong grids live in shared memory, a worker reads the halo rows of its
+neighbours straight from the shared grid and writes only its own strip, one
+barrier per step makes sure every strip of the new grid is complete before it is
+read, so no grid is ever copied between processes.
+"""
+import argparse
+import os
+import queue
+from multiprocessing import Barrier, Process, Queue, shared_memory
+from threading import BrokenBarrierError
+from time import perf_counter as timer
+import numpy as np
+from diffusion import evolve_strip, set_initial_conditions
+
+
+def strip_bounds(n_rows, n_workers, rank):
+    """Rows [r0, r1) of the strip owned by rank, the strips differ by at most one row"""
+    base, extra = divmod(n_rows, n_workers)
+    r0 = rank * base + min(rank, extra)
+    return r0, r0 + base + (rank < extra)
+
+
+def _evolve_strip_steps(rank, n_workers, grids, num_iterations, dt, barrier):
+    shape = grids[0].shape
+    r0, r1 = strip_bounds(shape[0], n_workers, rank)
+    work = (np.empty((r1 - r0, shape[1])), np.empty((r1 - r0, shape[1])))
+    barrier.wait()
+    t0 = timer()
+    for step in range(num_iterations):
+        evolve_strip(grids[step % 2], grids[(step + 1) % 2], work, r0, r1, dt)
+        # the halo rows of the next step are the neighbours' rows written in this one
+        barrier.wait()
+    return timer() - t0
+
+
+def _worker(rank, n_workers, shm_names, shape, num_iterations, dt, barrier, times):
+    """Reports (rank, elapsed, error) on times, a failing worker aborts the barrier
+    so the others do not wait for it forever"""
+    shms = [shared_memory.SharedMemory(name=name) for name in shm_names]
+    try:
+        grids = [np.ndarray(shape, dtype=np.float64, buffer=shm.buf) for shm in shms]
+        elapsed = _evolve_strip_steps(rank, n_workers, grids, num_iterations, dt, barrier)
+        times.put((rank, elapsed, None))
+    except BrokenBarrierError:
+        # another worker failed and reports the error
+        times.put((rank, None, None))
+    except Exception as e:
+        barrier.abort()
+        times.put((rank, None, f"{type(e).__name__}: {e}"))
+    finally:
+        grids = None
+        for shm in shms:
+            shm.close()
+
+
+def _collect(times, workers, barrier, timeout=1.0):
+    """The reports of all workers, raises RuntimeError if one of them failed"""
+    reports = []
+    while len(reports) < len(workers):
+        try:
+            reports.append(times.get(timeout=timeout))
+        except queue.Empty:
+            # a worker that died without a report (killed, crashed) leaves the others in the barrier
+            dead = [worker for worker in workers if worker.exitcode not in (None, 0)]
+            if dead:
+                barrier.abort()
+                raise RuntimeError(f"worker died with exit code {dead[0].exitcode}")
+    errors = [f"worker {rank}: {error}" for rank, _, error in reports if error is not None]
+    if errors or any(elapsed is None for _, elapsed, _ in reports):
+        raise RuntimeError("parallel diffusion failed, " + "; ".join(errors or ["barrier broken"]))
+    return reports
+
+
+def run_parallel(num_iterations, n_workers, shape, dt=0.1):
+    """Evolve the dye drop on n_workers processes, returns the final grid and the
+    time of the slowest worker (process start-up excluded)"""
+    assert shape[0] >= n_workers, "every worker needs at least one row"
+    nbytes = shape[0] * shape[1] * np.dtype(np.float64).itemsize
+    shms = [shared_memory.SharedMemory(create=True, size=nbytes) for _ in range(2)]
+    try:
+        grid = np.ndarray(shape, dtype=np.float64, buffer=shms[0].buf)
+        grid[:] = 0.0
+        set_initial_conditions(grid, shape)
+        barrier = Barrier(n_workers)
+        times = Queue()
+        workers = [Process(target=_worker, args=(rank, n_workers, [shm.name for shm in shms], shape,
+                                                  num_iterations, dt, barrier, times))
+                   for rank in range(n_workers)]
+        for worker in workers:
+            worker.start()
+        try:
+            elapsed = max(elapsed for _, elapsed, _ in _collect(times, workers, barrier))
+        finally:
+            for worker in workers:
+                worker.join()
+        result = np.ndarray(shape, dtype=np.float64, buffer=shms[num_iterations % 2].buf).copy()
+        del grid
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+    return result, elapsed
+
+
+def scaling_report(num_iterations, max_workers, size, rows_per_worker):
+    """Strong scaling on a size x size grid and weak scaling with rows_per_worker x size
+    rows per worker for 1, ..., max_workers workers"""
+    print(f"strong scaling, {size}x{size} grid, {num_iterations} steps")
+    base = None
+    for n in range(1, max_workers + 1):
+        _, elapsed = run_parallel(num_iterations, n, (size, size))
+        base = elapsed if base is None else base
+        print(f"{n:>3} workers: {elapsed:.3f} s, speed-up {base / elapsed:.2f}, efficiency {base / elapsed / n:.2f}")
+    print(f"weak scaling, {rows_per_worker}x{size} rows per worker, {num_iterations} steps")
+    base = None
+    for n in range(1, max_workers + 1):
+        _, elapsed = run_parallel(num_iterations, n, (n * rows_per_worker, size))
+        base = elapsed if base is None else base
+        print(f"{n:>3} workers: {elapsed:.3f} s, efficiency {base / elapsed:.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Strong and weak scaling of the parallel diffusion solver")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="largest number of workers")
+    parser.add_argument("--size", type=int, default=2048, help="grid side for strong scaling")
+    parser.add_argument("--rows-per-worker", type=int, default=512, help="strip height for weak scaling")
+    args = parser.parse_args()
+    scaling_report(args.iterations, args.workers, args.size, args.rows_per_worker)
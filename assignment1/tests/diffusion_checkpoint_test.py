@@ -0,0 +1,36 @@
+import errno
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from diffusion_checkpoint import latest_checkpoint, run_checkpointed
+
+
+def test_resume(tmp_path):
+    # 30 steps in one go and 20 + 10 steps with a restart must give the same grid
+    shape = (32, 32)
+    result = run_checkpointed(30, tmp_path / "full", interval=10, shape=shape)
+    run_checkpointed(20, tmp_path / "restart", interval=10, shape=shape)
+    assert latest_checkpoint(tmp_path / "restart")[0] == 20
+    np.testing.assert_array_equal(run_checkpointed(30, tmp_path / "restart", interval=10, shape=shape), result)
+
+
+
+def test_resume_shorter_run(tmp_path):
+    # a 10 step run in a directory with snapshots up to step 30 resumes from step 10, not 30
+    shape = (32, 32)
+    result = run_checkpointed(10, tmp_path / "short", interval=10, shape=shape)
+    run_checkpointed(30, tmp_path / "long", interval=10, shape=shape)
+    np.testing.assert_array_equal(run_checkpointed(10, tmp_path / "long", interval=10, shape=shape), result)
+    assert latest_checkpoint(tmp_path / "long", 25)[0] == 20
+
+
+def test_write_error(tmp_path, monkeypatch):
+    def disk_full(*args, **kwargs):
+        raise OSError(errno.ENOSPC, "No space left on device")
+    monkeypatch.setattr(np.lib.format, "open_memmap", disk_full)
+    # the final snapshot waits for a buffer, it must get one back and raise instead of blocking
+    with pytest.raises(OSError, match="No space left"):
+        run_checkpointed(5, tmp_path, interval=1, shape=(16, 16))
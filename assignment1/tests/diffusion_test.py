@@ -0,0 +1,84 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import diffusion
+import diffusion_parallel
+from diffusion import evolve_blocked, evolve_numpy, evolve_strip, run_experiment, set_initial_conditions
+from diffusion_parallel import run_parallel
+
+
+def random_grid(shape):
+    return np.random.default_rng(0).random(shape)
+
+
+def test_evolve_numpy(monkeypatch):
+    # evolve and run_experiment work on the module's grid_shape
+    monkeypatch.setattr(diffusion, "grid_shape", (24, 20))
+    result = run_experiment(10, "numpy")
+    np.testing.assert_array_equal(result, np.array(run_experiment(10, "list")))
+
+
+@pytest.mark.parametrize("rows", [1, 2, 3])
+def test_evolve_strip(rows):
+    # strips at the top, in the middle and at the bottom, the first and last wrap around
+    shape = (7, 8)
+    grid = random_grid(shape)
+    result = evolve_numpy(grid, np.empty(shape), (np.empty(shape), np.empty(shape)), 0.1)
+    for r0 in (0, 3, shape[0] - rows):
+        new_grid = np.zeros(shape)
+        evolve_strip(grid, new_grid, (np.empty((rows, 8)), np.empty((rows, 8))), r0, r0 + rows, 0.1)
+        np.testing.assert_array_equal(new_grid[r0:r0 + rows], result[r0:r0 + rows])
+
+
+@pytest.mark.parametrize("steps_per_block, steps", [(1, 5), (3, 13), (8, 13), (12, 30), (40, 41)])
+@pytest.mark.parametrize("tile", [None, (5, 7)])
+def test_evolve_blocked(steps_per_block, steps, tile):
+    # steps is not a multiple of steps_per_block, the 5x7 tiles do not divide the grid and the halo of 40
+    # steps is wider than the grid
+    shape = (23, 19)
+    grid = random_grid(shape)
+    result = grid.copy()
+    new_grid = np.empty(shape)
+    work = (np.empty(shape), np.empty(shape))
+    for _ in range(steps):
+        evolve_numpy(result, new_grid, work, 0.1)
+        result, new_grid = new_grid, result
+    for i in range(0, steps, steps_per_block):
+        evolve_blocked(grid, new_grid, min(steps_per_block, steps - i), 0.1, tile=tile)
+        grid, new_grid = new_grid, grid
+    np.testing.assert_array_equal(grid, result)
+
+
+def test_set_initial_conditions():
+    # wider than high, the drop must stay inside the grid
+    grid = np.zeros((20, 40))
+    set_initial_conditions(grid, grid.shape)
+    assert np.count_nonzero(grid) == 2 * 4
+
+
+def test_run_parallel():
+    # one row strips
+    shape = (4, 8)
+    grid = np.zeros(shape)
+    set_initial_conditions(grid, shape)
+    new_grid = np.empty(shape)
+    work = (np.empty(shape), np.empty(shape))
+    for _ in range(2):
+        evolve_numpy(grid, new_grid, work, 0.1)
+        grid, new_grid = new_grid, grid
+    result, _ = run_parallel(2, 4, shape)
+    np.testing.assert_array_equal(result, grid)
+
+
+def test_run_parallel_failure(monkeypatch):
+    def fail(grid, new_grid, work, r0, r1, dt):
+        if r0 == 0:
+            raise ValueError("strip failed")
+        return evolve_strip(grid, new_grid, work, r0, r1, dt)
+    # the workers are forked and inherit the patched function
+    monkeypatch.setattr(diffusion_parallel, "evolve_strip", fail)
+    with pytest.raises(RuntimeError, match="strip failed"):
+        run_parallel(2, 3, (6, 8))
@@ -1,6 +1,9 @@
 """Julia set generator without optional PIL-based image drawing"""
 import time
 from functools import wraps
+from itertools import islice
+from numbers import Number
+import numpy as np
 
 # area of complex space to investigate
 x1, x2, y1, y2 = -1.8, 1.8, -1.8, 1.8
@@ -18,58 +21,248 @@ def timefn(fn):
     return measure_time
 
 
-def calc_pure_python(desired_width, max_iterations):
-    """Create a list of complex coordinates (zs) and complex parameters (cs),
-    build Julia set"""
-    x_step = (x2 - x1) / desired_width
-    y_step = (y1 - y2) / desired_width
-    x = []
-    y = []
-    ycoord = y2
-    while ycoord > y1:
-        y.append(ycoord)
-        ycoord += y_step
-    xcoord = x1
-    while xcoord < x2:
-        x.append(xcoord)
-        xcoord += x_step
-    # build a list of coordinates and the initial condition for each cell.
-    # Note that our initial condition is a constant and could easily be removed,
-    # we use it to simulate a real-world scenario with several inputs to our
-    # function
-    zs = []
-    cs = []
-    for ycoord in y:
-        for xcoord in x:
-            zs.append(complex(xcoord, ycoord))
-            cs.append(complex(c_real, c_imag))
-
-    print("Length of x:", len(x))
-    print("Total elements:", len(zs))
+def axis_coords(start, stop, step):
+    """Yield the coordinates start, start + step, ... up to (not including) stop.
+    The coordinate is accumulated like in the original while loops so the
+    values are bitwise the same"""
+    coord = start
+    if step > 0:
+        while coord < stop:
+            yield coord
+            coord += step
+    else:
+        while coord > stop:
+            yield coord
+            coord += step
+
+
+def grid_axes(desired_width, area=(x1, x2, y1, y2)):
+    """Lazy real (x) and imaginary (y) axes of the grid over area = (x1, x2, y1, y2),
+    y runs from the top row downwards"""
+    ax1, ax2, ay1, ay2 = area
+    x_step = (ax2 - ax1) / desired_width
+    y_step = (ay1 - ay2) / desired_width
+    return axis_coords(ax1, ax2, x_step), axis_coords(ay2, ay1, y_step)
+
+
+def grid_shape(desired_width, area=(x1, x2, y1, y2)):
+    """(rows, columns) of the grid, counted without storing the coordinates"""
+    x, y = grid_axes(desired_width, area)
+    return sum(1 for _ in y), sum(1 for _ in x)
+
+
+def iter_row_tiles(desired_width, rows_per_tile, area=(x1, x2, y1, y2)):
+    """
+    Yield (ys, zs) for consecutive tiles of at most rows_per_tile rows, ys are the
+    imaginary coordinates of the tile rows and zs the list of complex coordinates
+    of the tile in row major order. Only one tile is kept in memory at a time.
+    """
+    x, y = grid_axes(desired_width, area)
+    x = list(x)
+    while True:
+        ys = list(islice(y, rows_per_tile))
+        if not ys:
+            return
+        yield ys, [complex(xcoord, ycoord) for ycoord in ys for xcoord in x]
+
+
+def calc_pure_python(desired_width, max_iterations, backend="python", rows_per_tile=64, area=(x1, x2, y1, y2)):
+    """Build Julia set over area = (x1, x2, y1, y2) using the kernel given by backend
+    (see backends). The complex coordinates (zs) are generated tile by tile and the
+    parameter c is a scalar, memory use grows with rows_per_tile and not with the grid"""
+    c = complex(c_real, c_imag)
+    kernel = backends[backend]
+    n_rows, n_columns = grid_shape(desired_width, area)
+    print("Length of x:", n_columns)
+    print("Total elements:", n_rows * n_columns)
+    output_sum = 0
     start_time = time.time()
-    output = calculate_z_serial_purepython(max_iterations, zs, cs)
+    for _, zs in iter_row_tiles(desired_width, rows_per_tile, area):
+        output_sum += sum(kernel(max_iterations, zs, c))
     end_time = time.time()
     secs = end_time - start_time
-    print(calculate_z_serial_purepython.__name__ + " took", secs, "seconds")
+    print(kernel.__name__ + " took", secs, "seconds")
 
     # This sum is expected for a 1000^2 grid with 300 iterations
     # It ensures that our code evolves exactly as we'd intended
-    assert sum(output) == 33219980
+    if desired_width == 1000 and max_iterations == 300 and area == (x1, x2, y1, y2):
+        assert output_sum == 33219980
+
 
 def calculate_z_serial_purepython(maxiter, zs, cs):
-    """Calculate output list using Julia update rule"""
+    """Calculate output list using Julia update rule, cs is either a list with one
+    parameter per coordinate or a single complex constant"""
+    output = [0] * len(zs)
+    scalar_c = isinstance(cs, Number)
+    for i in range(len(zs)):
+        n = 0
+        z = zs[i]
+        c = cs if scalar_c else cs[i]
+        while abs(z) < 2 and n < maxiter:
+            z = z * z + c
+            n += 1
+        output[i] = n
+    return output
+
+
+def calculate_z_numpy(maxiter, zs, cs):
+    """Calculate output array using Julia update rule, vectorised with numpy.
+    All points are iterated at once, escaped points are masked out so they
+    do no further work. Gives the same result as calculate_z_serial_purepython"""
+    z = np.array(zs, dtype=np.complex128)
+    c = np.array(cs, dtype=np.complex128)
+    scalar_c = c.ndim == 0
+    output = np.zeros(z.shape, dtype=np.int64)
+    idx = np.arange(z.size)
+    for n in range(maxiter):
+        # drop the points that have escaped, abs() matches the python version bitwise
+        active = np.abs(z) < 2
+        if not active.all():
+            idx = idx[active]
+            z = z[active]
+            if not scalar_c:
+                c = c[active]
+        if idx.size == 0:
+            break
+        z = z * z + c
+        output[idx] += 1
+    return output
+
+
+def calculate_z_numpy_resume(maxiter, z, n, c):
+    """Continue the Julia iteration in place from the state z, n (escape counts so
+    far) until every point has escaped or reached maxiter. z and n as left by an
+    earlier call with a lower maxiter are resumed without redoing any iterations,
+    starting from z = zs and n = 0 gives the same counts as calculate_z_numpy.
+    z and n must be contiguous arrays of the same shape"""
+    z_flat = z.ravel()
+    n_flat = n.ravel()
+    idx = np.flatnonzero((np.abs(z_flat) < 2) & (n_flat < maxiter))
+    zi = z_flat[idx]
+    ni = n_flat[idx]
+    while idx.size:
+        zi = zi * zi + c
+        ni += 1
+        active = (np.abs(zi) < 2) & (ni < maxiter)
+        if not active.all():
+            # write back the points that are done
+            done = ~active
+            z_flat[idx[done]] = zi[done]
+            n_flat[idx[done]] = ni[done]
+            idx = idx[active]
+            zi = zi[active]
+            ni = ni[active]
+    return n
+
+
+def calculate_z_serial_periodic(maxiter, zs, cs, tol=1e-4):
+    """Calculate output list using Julia update rule with Brent style periodicity
+    checking. z is compared to a saved orbit point which is moved forward after
+    1, 2, 4, ... iterations, if z comes back to it within tol the orbit is periodic,
+    it never escapes and the point is given maxiter straight away"""
     output = [0] * len(zs)
+    scalar_c = isinstance(cs, Number)
     for i in range(len(zs)):
         n = 0
         z = zs[i]
-        c = cs[i]
+        c = cs if scalar_c else cs[i]
+        saved = z
+        steps = 0
+        limit = 1
         while abs(z) < 2 and n < maxiter:
             z = z * z + c
             n += 1
+            if abs(z - saved) < tol:
+                n = maxiter
+                break
+            steps += 1
+            if steps == limit:
+                saved = z
+                steps = 0
+                limit *= 2
         output[i] = n
     return output
 
+
+def calculate_z_numpy_periodic(maxiter, zs, cs, tol=1e-4):
+    """calculate_z_numpy with the periodicity checking of calculate_z_serial_periodic,
+    points caught in a cycle are masked out like the escaped ones"""
+    z = np.array(zs, dtype=np.complex128)
+    c = np.array(cs, dtype=np.complex128)
+    scalar_c = c.ndim == 0
+    output = np.zeros(z.shape, dtype=np.int64)
+    idx = np.arange(z.size)
+    saved = z.copy()
+    steps = 0
+    limit = 1
+    for n in range(maxiter):
+        active = np.abs(z) < 2
+        if not active.all():
+            idx = idx[active]
+            z = z[active]
+            saved = saved[active]
+            if not scalar_c:
+                c = c[active]
+        if idx.size == 0:
+            break
+        z = z * z + c
+        output[idx] += 1
+        periodic = np.abs(z - saved) < tol
+        if periodic.any():
+            output[idx[periodic]] = maxiter
+            active = ~periodic
+            idx = idx[active]
+            z = z[active]
+            saved = saved[active]
+            if not scalar_c:
+                c = c[active]
+        # all points start together so the Brent schedule is shared
+        steps += 1
+        if steps == limit:
+            saved = z.copy()
+            steps = 0
+            limit *= 2
+    return output
+
+
+def verify_periodic(desired_width, max_iterations, area=(x1, x2, y1, y2), tol=1e-4, rows_per_tile=64):
+    """
+    Verification mode for the periodicity checking, computes the histogram of
+    iteration counts over the grid with calculate_z_numpy_periodic and with the
+    exhaustive calculate_z_numpy. Returns the number of points that ended up in
+    a different histogram bin, 0 means the early exit did not change the result.
+    """
+    c = complex(c_real, c_imag)
+    hist_exhaustive = np.zeros(max_iterations + 1, dtype=np.int64)
+    hist_periodic = np.zeros(max_iterations + 1, dtype=np.int64)
+    time_exhaustive = 0.0
+    time_periodic = 0.0
+    for _, zs in iter_row_tiles(desired_width, rows_per_tile, area):
+        t0 = time.time()
+        output = calculate_z_numpy(max_iterations, zs, c)
+        time_exhaustive += time.time() - t0
+        hist_exhaustive += np.bincount(output, minlength=max_iterations + 1)
+        t0 = time.time()
+        output = calculate_z_numpy_periodic(max_iterations, zs, c, tol)
+        time_periodic += time.time() - t0
+        hist_periodic += np.bincount(output, minlength=max_iterations + 1)
+    diff = hist_periodic - hist_exhaustive
+    mismatches = int(np.abs(diff).sum() // 2)
+    print(f"exhaustive took {time_exhaustive} seconds, periodic took {time_periodic} seconds "
+          f"(speed-up {time_exhaustive / time_periodic:.2f})")
+    print(f"histogram bins differing: {np.count_nonzero(diff)}, points moved: {mismatches}")
+    return mismatches
+
+
+# selectable Julia set kernels, all take (maxiter, zs, cs)
+backends = {
+    "python": calculate_z_serial_purepython,
+    "numpy": calculate_z_numpy,
+    "python-periodic": calculate_z_serial_periodic,
+    "numpy-periodic": calculate_z_numpy_periodic,
+}
+
 if __name__ == "__main__":
     # Calculate the Julia set using a pure Python solution with
     # reasonable defaults for a laptop
-    calc_pure_python(desired_width=10000, max_iterations=300) 
\ No newline at end of file
+    calc_pure_python(desired_width=10000, max_iterations=300, backend="numpy") 
\ No newline at end of file
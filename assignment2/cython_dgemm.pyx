@@ -0,0 +1,130 @@
+"""
+Cython DGEMM, C = C + A*B on C-contiguous 2D float64 arrays.
+Blocked like the BLAS libraries: B is packed in KC x NC blocks into panels of NR
+columns, A in MC x KC blocks into panels of MR rows, so that the micro-kernel
+reads both with unit stride. The micro-kernel keeps an MR x NR block of C in
+registers for the whole KC long update.
+"""
+
+import numpy as np
+cimport cython
+from cython.parallel cimport prange, threadid
+from libc.stdlib cimport malloc, free
+from openmp cimport omp_get_max_threads
+
+cdef enum:
+    MR = 4      # register block
+    NR = 4
+    MC = 64     # A block, MC x KC stays in L2
+    KC = 256
+    NC = 1024   # B block, KC x NC stays in L3
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void pack_a(const double* A, Py_ssize_t lda, int mc, int kc, double* buf) noexcept nogil:
+    # panels of MR rows, k major inside a panel, the last panel is zero padded
+    cdef int p, k, r, i
+    for p in range((mc + MR - 1) // MR):
+        for k in range(kc):
+            for r in range(MR):
+                i = p * MR + r
+                buf[0] = A[i * lda + k] if i < mc else 0.0
+                buf += 1
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void pack_b(const double* B, Py_ssize_t ldb, int kc, int nc, double* buf) noexcept nogil:
+    # panels of NR columns, k major inside a panel, the last panel is zero padded
+    cdef int q, k, c, j
+    for q in range((nc + NR - 1) // NR):
+        for k in range(kc):
+            for c in range(NR):
+                j = q * NR + c
+                buf[0] = B[k * ldb + j] if j < nc else 0.0
+                buf += 1
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void micro_kernel(int kc, const double* a, const double* b, double* C, Py_ssize_t ldc,
+                       int mr, int nr) noexcept nogil:
+    cdef double c[MR][NR]
+    cdef int k, r, s
+    cdef double ar
+    for r in range(MR):
+        for s in range(NR):
+            c[r][s] = 0.0
+    for k in range(kc):
+        for r in range(MR):
+            ar = a[r]
+            for s in range(NR):
+                c[r][s] += ar * b[s]
+        a += MR
+        b += NR
+    for r in range(mr):
+        for s in range(nr):
+            C[r * ldc + s] += c[r][s]
+
+
+@cython.cdivision(True)
+cdef void block_update(const double* A, Py_ssize_t lda, const double* bpack, double* C, Py_ssize_t ldc,
+                       int mc, int kc, int nc, double* apack) noexcept nogil:
+    # C[mc, nc] += A[mc, kc] * B[kc, nc] with B already packed
+    cdef int i, j
+    pack_a(A, lda, mc, kc, apack)
+    for j in range((nc + NR - 1) // NR):
+        for i in range((mc + MR - 1) // MR):
+            micro_kernel(kc, apack + i * MR * kc, bpack + j * NR * kc, C + i * MR * ldc + j * NR, ldc,
+                         min(MR, mc - i * MR), min(NR, nc - j * NR))
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def dgemm(double[:, ::1] A, double[:, ::1] B, double[:, ::1] C, bint parallel=False, int num_threads=0):
+    """
+    C = C + A*B for A (n x k), B (k x m), C (n x m). With parallel the MC row blocks
+    of every packed B block are shared out over OpenMP threads (num_threads=0 uses
+    the OpenMP default), the GIL is released for the whole computation.
+    """
+    cdef Py_ssize_t n = A.shape[0], k = A.shape[1], m = B.shape[1]
+    if B.shape[0] != k or C.shape[0] != n or C.shape[1] != m:
+        raise ValueError("dgemm shape mismatch")
+    if n == 0 or k == 0 or m == 0:
+        return
+    cdef const double* a = &A[0, 0]
+    cdef const double* b = &B[0, 0]
+    cdef double* c = &C[0, 0]
+    cdef Py_ssize_t j0, k0, jb, kb, ib, n_blocks = (n + MC - 1) // MC
+    cdef int nc, kc
+    cdef int threads = num_threads if num_threads > 0 else omp_get_max_threads()
+    cdef Py_ssize_t apack_size = KC * (MC + MR)
+    cdef double* bpack = <double*> malloc(KC * (NC + NR) * sizeof(double))
+    # one A block buffer per thread, thread t packs into apack + t * apack_size
+    cdef double* apack = <double*> malloc((threads if parallel else 1) * apack_size * sizeof(double))
+    if bpack == NULL or apack == NULL:
+        free(bpack)
+        free(apack)
+        raise MemoryError()
+    with nogil:
+        for jb in range((m + NC - 1) // NC):
+            j0 = jb * NC
+            nc = min(NC, m - j0)
+            for kb in range((k + KC - 1) // KC):
+                k0 = kb * KC
+                kc = min(KC, k - k0)
+                pack_b(b + k0 * m + j0, m, kc, nc, bpack)
+                if parallel:
+                    for ib in prange(n_blocks, schedule='dynamic', num_threads=threads):
+                        block_update(a + ib * MC * k + k0, k, bpack, c + ib * MC * m + j0, m,
+                                     min(MC, n - ib * MC), kc, nc, apack + threadid() * apack_size)
+                else:
+                    for ib in range(n_blocks):
+                        block_update(a + ib * MC * k + k0, k, bpack, c + ib * MC * m + j0, m,
+                                     min(MC, n - ib * MC), kc, nc, apack)
+    free(bpack)
+    free(apack)
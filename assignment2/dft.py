@@ -3,6 +3,9 @@ Author: Johan Ericsson
 Date: 2022-02-14
 """
 
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 
 
@@ -31,6 +34,231 @@ def DFT2(xre, xim ,Xre, Xim):
 
 
 
+def DFT3(xre, xim, Xre, Xim):
+    """DFT2 without trig calls in the loops, cos(w k n) and sin(w k n) are looked up
+    in tables of the N roots of unity at m = (k n) % N, m is advanced by k per step"""
+    N = len(xre)
+    w = 2*np.pi/N
+    cos_table = np.cos(w*np.arange(N)).tolist()
+    sin_table = np.sin(w*np.arange(N)).tolist()
+    for k in range(N):
+        re = 0.0
+        im = 0.0
+        m = 0
+        for n in range(N):
+            c = cos_table[m]
+            s = sin_table[m]
+            re += xre[n]*c + xim[n]*s
+            im += -xre[n]*s + xim[n]*c
+            m += k
+            if m >= N:
+                m -= N
+        Xre[k] = re
+        Xim[k] = im
+
+
+def twiddle_errors(N, bins=32, seed=0):
+    """
+    Max error against np.fft.fft of the DFT sum with twiddles from
+    - trig: exp(-i w k n) evaluated directly as in DFT/DFT2
+    - table: the table of N roots of unity at (k n) % N as in DFT3
+    - recurrence: w_k^n by repeated multiplication with w_k (a rotation recurrence)
+    for a random signal of length N, only `bins` random frequencies k are summed so
+    that large N stay affordable.
+    """
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=N) + 1j * rng.normal(size=N)
+    Xref = np.fft.fft(x)
+    n = np.arange(N)
+    roots = np.exp(-2j * np.pi * n / N)
+    errors = {"trig": 0.0, "table": 0.0, "recurrence": 0.0}
+    for k in rng.choice(N, size=min(bins, N), replace=False):
+        trig = np.exp(-2j * np.pi * k * n / N)
+        table = roots[(k * n) % N]
+        recurrence = np.cumprod(np.full(N, roots[k]))
+        recurrence = np.concatenate(([1.0], recurrence[:-1]))
+        for name, twiddle in (("trig", trig), ("table", table), ("recurrence", recurrence)):
+            errors[name] = max(errors[name], abs(np.dot(x, twiddle) - Xref[k]))
+    return errors
+
+
+def print_twiddle_errors(sizes=(2**10, 10**4, 2**16, 10**5)):
+    print(f"{'N':>8} {'trig':>12} {'table':>12} {'recurrence':>12}")
+    for N in sizes:
+        e = twiddle_errors(N)
+        print(f"{N:>8} {e['trig']:12.3e} {e['table']:12.3e} {e['recurrence']:12.3e}")
+
+
+class FFTPlan:
+    """
+    Precomputed tables for an N point FFT.
+    Power of two N: the bit reversal permutation and one contiguous twiddle table
+    per butterfly stage. Other N (Bluestein): the chirp exp(-i pi n^2 / N) and the
+    FFT of the chirp filter, both for the power of two size M >= 2N - 1 whose own
+    plan does the convolution.
+    """
+    def __init__(self, N):
+        self.N = N
+        self.radix2 = N & (N - 1) == 0
+        if self.radix2:
+            bits = N.bit_length() - 1
+            n = np.arange(N)
+            self.bitrev = np.zeros(N, dtype=np.intp)
+            for b in range(bits):
+                self.bitrev |= ((n >> b) & 1) << (bits - 1 - b)
+            # stage with butterflies of size m uses w_m^j = exp(-2 pi i j / m), j < m/2
+            self.twiddles = []
+            m = 2
+            while m <= N:
+                self.twiddles.append(np.exp(-2j * np.pi * np.arange(m // 2) / m))
+                m *= 2
+        else:
+            self.M = 1 << (2 * N - 2).bit_length()
+            n = np.arange(N)
+            # n^2 mod 2N keeps the argument small, n^2 itself loses precision for large N
+            self.chirp = np.exp(-1j * np.pi * ((n * n) % (2 * N)) / N)
+            b = np.zeros(self.M, dtype=np.complex128)
+            b[:N] = np.conj(self.chirp)
+            b[self.M - N + 1:] = np.conj(self.chirp[1:])[::-1]
+            self.filter = fft(b)
+
+    @property
+    def nbytes(self):
+        if self.radix2:
+            return self.bitrev.nbytes + sum(t.nbytes for t in self.twiddles)
+        return self.chirp.nbytes + self.filter.nbytes
+
+
+# fft_plan keeps the most recently used plans up to this many bytes
+FFT_PLAN_CACHE_BYTES = 64 * 2**20
+_fft_plans = OrderedDict()
+
+
+def fft_plan(N):
+    """Cached FFTPlan for N, the least recently used plans are dropped to keep the
+    cache below FFT_PLAN_CACHE_BYTES like the matrices of dft_matrix"""
+    plan = _fft_plans.get(N)
+    if plan is not None:
+        _fft_plans.move_to_end(N)
+        return plan
+    plan = FFTPlan(N)
+    if plan.nbytes <= FFT_PLAN_CACHE_BYTES:
+        _fft_plans[N] = plan
+        while sum(p.nbytes for p in _fft_plans.values()) > FFT_PLAN_CACHE_BYTES:
+            _fft_plans.popitem(last=False)
+    return plan
+
+
+def _fft_radix2(x, plan):
+    """Iterative radix-2 Cooley-Tukey over the last axis, every stage is done for
+    all butterflies at once"""
+    N = plan.N
+    X = x[..., plan.bitrev]
+    for twiddle in plan.twiddles:
+        half = len(twiddle)
+        Y = X.reshape(X.shape[:-1] + (N // (2 * half), 2 * half))
+        t = Y[..., half:] * twiddle
+        Y[..., half:] = Y[..., :half] - t
+        Y[..., :half] += t
+    return X
+
+
+def fft(x):
+    """FFT of x (numpy array like) along the last axis, same result as np.fft.fft.
+    Radix-2 for power of two lengths, Bluestein's algorithm otherwise"""
+    x = np.asarray(x, dtype=np.complex128)
+    N = x.shape[-1]
+    if N <= 1:
+        return x.copy()
+    plan = fft_plan(N)
+    if plan.radix2:
+        return _fft_radix2(x, plan)
+    # X_k = chirp_k * (a * b)_k with a_n = x_n chirp_n, the convolution is done with M point FFTs
+    a = np.zeros(x.shape[:-1] + (plan.M,), dtype=np.complex128)
+    a[..., :N] = x * plan.chirp
+    conv = fft(a) * plan.filter
+    # inverse FFT through the forward one: ifft(y) = conj(fft(conj(y))) / M
+    conv = np.conj(fft(np.conj(conv))) / plan.M
+    return conv[..., :N] * plan.chirp
+
+
+def FFT(xre, xim, Xre, Xim):
+    """fft with the list interface of DFT"""
+    X = fft(np.array(xre, dtype=np.float64) + 1j * np.array(xim, dtype=np.float64))
+    Xre[:] = X.real
+    Xim[:] = X.imag
+
+
+
+def fft_batch(x, out=None, n_threads=None, engine=fft):
+    """
+    FFT of a batch of independent signals x of shape (batch, N), the batch is
+    split into n_threads contiguous shards transformed on a thread pool. engine
+    is fft or np.fft.fft, both do their work in numpy calls that release the GIL
+    so the threads run in parallel. The result is written to out (allocated if
+    not given) and returned.
+    """
+    x = np.asarray(x, dtype=np.complex128)
+    if x.ndim != 2:
+        # a 1-D signal would be split along its samples
+        raise ValueError(f"fft_batch needs a batch of shape (batch, N), got shape {x.shape}")
+    if out is None:
+        out = np.empty_like(x)
+    if n_threads is None:
+        n_threads = os.cpu_count()
+    n_threads = max(1, min(n_threads, len(x)))
+    bounds = np.linspace(0, len(x), n_threads + 1).astype(int)
+
+    def transform(shard):
+        start, stop = bounds[shard], bounds[shard + 1]
+        out[start:stop] = engine(x[start:stop])
+
+    if n_threads == 1:
+        transform(0)
+    else:
+        with ThreadPoolExecutor(n_threads) as pool:
+            # list() so exceptions in the threads are raised here
+            list(pool.map(transform, range(n_threads)))
+    return out
+
+
+
+# dft_matrix keeps the most recently used matrices up to this many bytes
+DFT_MATRIX_CACHE_BYTES = 64 * 2**20
+_dft_matrices = OrderedDict()
+
+
+def dft_matrix(N):
+    """
+    N x N DFT matrix W[k, n] = exp(-2 pi i k n / N), cached. The entries are taken
+    from the table of the N roots of unity at (k n) % N, which is more accurate
+    than evaluating exp at k n for large N. The least recently used matrices are
+    dropped to keep the cache below DFT_MATRIX_CACHE_BYTES, a matrix larger than
+    that on its own is not cached.
+    """
+    W = _dft_matrices.get(N)
+    if W is not None:
+        _dft_matrices.move_to_end(N)
+        return W
+    n = np.arange(N)
+    roots = np.exp(-2j * np.pi * n / N)
+    W = roots[np.outer(n, n) % N]
+    if W.nbytes <= DFT_MATRIX_CACHE_BYTES:
+        _dft_matrices[N] = W
+        while sum(M.nbytes for M in _dft_matrices.values()) > DFT_MATRIX_CACHE_BYTES:
+            _dft_matrices.popitem(last=False)
+    return W
+
+
+def dft_matmul(x):
+    """DFT of a signal x of length N or of a batch of signals of shape (batch, N)
+    as a single matrix product (one BLAS call) with the cached DFT matrix"""
+    x = np.asarray(x, dtype=np.complex128)
+    # W is symmetric so x W^T = x W
+    return x @ dft_matrix(x.shape[-1])
+
+
+
 if __name__ == '__main__':
     N = 1024
     t = np.linspace(0, 1, N)
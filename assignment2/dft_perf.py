@@ -3,16 +3,16 @@ Author: Johan Ericsson
 Date: 2022-03-14
 """
 
+import os
+import sys
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib import rcParams
-from dft import DFT, DFT2
-from time import perf_counter_ns as timer
+from dft import DFT, DFT2, DFT3, fft, print_twiddle_errors
 
-SAVE_FIG = False
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+from harness import Registry, make_parser, main as run_benchmarks
 
 
-def time_dft(n):
+def signal_lists(n):
     # generation of a wave with a random error term
     t = np.linspace(0, 1, n)
     s = np.random.normal(0, 0.1, n)
@@ -22,59 +22,36 @@ def time_dft(n):
     # DFT arrays
     Xre = [0 for _ in range(n)]
     Xim = [0 for _ in range(n)]
+    return xre, xim, Xre, Xim
 
-    # complex np array
-    xnp = np.array(xre) + np.array(xim)*1j
-
-    # DFT list implementation timing
-    t0 = timer()
-    DFT(xre, xim, Xre, Xim)
-    elapsed_time = timer() - t0
-
-    # np.fft.fft timing
-    t0 = timer()
-    X = np.fft.fft(xnp)
-    elapsed_time_np = timer() - t0
-    mu = np.mean(X)
-
-    # DFT2 timing
-    t0 = timer()
-    DFT2(xre, xim , Xre, Xim)
-    dft2_time = timer() - t0
-
-    return elapsed_time, elapsed_time_np, dft2_time
-
-
-N = [8] + [64*i for i in range(1, 17)] # should be up to 16 (64*16=1024)
-timings = []
-timings_np = []
-timings_dft2 = []
 
-for n in N:
-    t, tnp, t_dft2 =time_dft(n)
-    timings.append(t*1e-9)
-    timings_np.append(tnp*1e-9)
-    timings_dft2.append(t_dft2*1e-9)
-
-# plotting
-rcParams.update({'font.size': 20})
-fig, ax = plt.subplots(figsize=(16, 10))
-ax.set_xlabel("Container size")
-ax.set_ylabel("Execution time (s)")
-
-ax.plot(N, timings, "o:", label='DFT list implementation', linewidth=2.0)
-ax.plot(N, timings_np, "o:", label='numpy.fft.fft', linewidth=2.0)
-# plt.plot(N, timings_dft2, "o:", label='DFT2 list implementation', linewidth=2.0)
-ax.legend()
-
-#ax.set(yscale="log")
-plt.grid(True, which="both")
-ax.set_xticks(N, minor=False)
-fig.suptitle("DFT execution times")
-fig.tight_layout()
-
-
-if SAVE_FIG:
-    fig.savefig("figures/dft_execution_times.pdf", format="pdf")
-
-plt.show()
+def signal_numpy(n):
+    # complex np array
+    xre, xim, _, _ = signal_lists(n)
+    return (np.array(xre) + np.array(xim)*1j,)
+
+
+def dft_registry(N):
+    """
+    DFT cases, the list implementations against numpy.fft.fft and dft.fft. The
+    fft plan (twiddles, Bluestein chirp) is made in the warm-up run like numpy's
+    cached twiddles.
+    """
+    registry = Registry()
+    registry.register("dft", "DFT list implementation", N, signal_lists, DFT)
+    registry.register("dft", "numpy.fft.fft", N, signal_numpy, np.fft.fft)
+    registry.register("dft", "dft.fft (radix-2/Bluestein)", N, signal_numpy, fft)
+    registry.register("dft", "DFT2 list implementation", N, signal_lists, DFT2)
+    registry.register("dft", "DFT3 twiddle table", N, signal_lists, DFT3)
+    return registry
+
+
+if __name__ == '__main__':
+    N = [8] + [64*i for i in range(1, 17)] # should be up to 16 (64*16=1024)
+    args = make_parser("DFT execution times", "dft_results.csv").parse_args()
+    run_benchmarks(dft_registry(N), args)
+
+    # max error of the twiddle factor methods against numpy.fft.fft
+    if not args.list:
+        print_twiddle_errors()
+    # execution time figure: python ../benchmarks/harness.py plot dft_results.csv --linear --out figures
@@ -3,11 +3,23 @@ Author: Johan Ericsson
 Date: 2022-02-14
 """
 
+import os
+import sys
+import tempfile
+import threading
+from queue import Full, Queue
 from time import perf_counter_ns as timer
 from array import array
 import numpy as np
 import numexpr as ne
-import matplotlib.pyplot as plt
+try:
+    # compiled with python setup.py build_ext --inplace
+    import cython_dgemm
+except ImportError:
+    cython_dgemm = None
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+from harness import Registry, make_parser, main as run_benchmarks
 
 
 def dgemm(A, B, C, N):
@@ -22,118 +34,376 @@ def dgemm(A, B, C, N):
                 C[i*N + j] += A[i*N + k] * B[k*N + j]
 
 
+def dgemm_blocked(A, B, C, N, block=64):
+    """
+    DGEMM C = C + A*B with the storage of dgemm, in i-k-j order: A[i, k] is loaded
+    once per row of B and the innermost loop walks a row of B and C with unit stride.
+    The loops are tiled in block x block blocks so the rows of B and C in use stay in
+    cache, and the row offsets i*N and k*N are hoisted out of the inner loops.
+    For every C[i, j] the k terms are still added in increasing k so the result is
+    the same as dgemm.
+    """
+    for ii in range(0, N, block):
+        i_end = min(ii + block, N)
+        for kk in range(0, N, block):
+            k_end = min(kk + block, N)
+            for jj in range(0, N, block):
+                j_end = min(jj + block, N)
+                for i in range(ii, i_end):
+                    row_a = i*N
+                    row_c = i*N
+                    for k in range(kk, k_end):
+                        a = A[row_a + k]
+                        offset = k*N - row_c
+                        for j in range(row_c + jj, row_c + j_end):
+                            C[j] += a * B[j + offset]
+
+
+def tune_dgemm_blocked(N=192, blocks=(8, 16, 32, 64, 128, 256), container=list):
+    """
+    Auto-tuner for dgemm_blocked, times every block size on an NxN problem in the
+    given container (list or array) and returns the fastest block size and the
+    timings {block: ns}
+    """
+    timings = {}
+    for block in blocks:
+        if container is list:
+            A, B, C = [1.0] * (N*N), [5.0] * (N*N), [0.0] * (N*N)
+        else:
+            A, B, C = array('d', [1.0] * (N*N)), array('d', [5.0] * (N*N)), array('d', [0.0] * (N*N))
+        t0 = timer()
+        dgemm_blocked(A, B, C, N, block)
+        timings[block] = timer() - t0
+    return min(timings, key=timings.get), timings
+
+
+def _check_shapes(A, B, C):
+    """(n, k, m) of A (n x k), B (k x m) and C (n x m), ValueError if they do not fit"""
+    n, k = A.shape
+    m = B.shape[1]
+    if B.shape[0] != k or C.shape != (n, m):
+        raise ValueError("dgemm shape mismatch")
+    return n, k, m
+
+
 def dgemm_numpy(A, B, C):
      C += A.dot(B)
 
 
-def dgemm_numexpr(A, B, C):
-    ne.evaluate("C + A*B", out=C)
+def dgemm_numexpr(A, B, C, depth=8):
+    """
+    C = C + A*B (matrix product) with numexpr. numexpr only knows element-wise
+    operations, so the product is split into rank-1 updates column(A) x row(B),
+    depth of them are fused into one expression "C + a0*b0 + ... " which is
+    broadcast to the shape of C. C is streamed once per depth values of k
+    instead of once per k, and the evaluation runs on numexpr's threads.
+    numexpr takes at most 32 operands, depth must stay below 16.
+    """
+    _, k, _ = _check_shapes(A, B, C)
+    for k0 in range(0, k, depth):
+        kb = min(depth, k - k0)
+        operands = {"C": C}
+        for t in range(kb):
+            operands[f"a{t}"] = A[:, k0 + t:k0 + t + 1]
+            operands[f"b{t}"] = B[k0 + t:k0 + t + 1, :]
+        expression = "C + " + " + ".join(f"a{t}*b{t}" for t in range(kb))
+        ne.evaluate(expression, local_dict=operands, out=C)
+
+
+def _memmap_schedule(n, k, m, tile):
+    """
+    Tile order of dgemm_memmap: every C tile is finished (all k tiles) before the
+    next one, so C is read and written once. The k tiles are visited back and forth
+    along a row of C tiles, the last A tile of one C tile is the first one of the
+    next and is not read again.
+    """
+    for i0 in range(0, n, tile):
+        for jb, j0 in enumerate(range(0, m, tile)):
+            ks = list(range(0, k, tile))
+            if jb % 2:
+                ks.reverse()
+            for kb, k0 in enumerate(ks):
+                yield i0, j0, k0, kb == 0, kb == len(ks) - 1
 
 
-def time_dgemm_list(N):
-    A = [1.0] * (N*N)
-    B = [5.0] * (N*N)
-    C = [0.0] * (N*N)
-    t0 = timer()
-    dgemm(A, B, C, N)
-    t1 = timer()
-    return t1 - t0
+def _put_unless_stopped(queue, item, stop):
+    """Put item in the queue, give up once stop is set (the consumer has failed)"""
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return True
+        except Full:
+            pass
+    return False
 
 
-def time_dgemm_array(N):
-    A = array('d', [1.0 for _ in range(N*N)])
-    B = array('d', [5.0 for _ in range(N*N)])
-    C = array('d', [0.0 for _ in range(N*N)])
-    t0 = timer()
-    dgemm(A, B, C, N)
-    t1 = timer()
-    return t1 - t0
+def _prefetch_tiles(A, B, C, tile, queue, stats, stop):
+    """Reads the tiles of the schedule into memory ahead of the multiplication"""
+    try:
+        n, k = A.shape
+        m = B.shape[1]
+        a_key = a = None
+        for i0, j0, k0, first, last in _memmap_schedule(n, k, m, tile):
+            t0 = timer()
+            if a_key != (i0, k0):
+                a_key = (i0, k0)
+                a = np.array(A[i0:i0 + tile, k0:k0 + tile])
+                stats["bytes_read"] += a.nbytes
+            b = np.array(B[k0:k0 + tile, j0:j0 + tile])
+            stats["bytes_read"] += b.nbytes
+            c = None
+            if first:
+                c = np.array(C[i0:i0 + tile, j0:j0 + tile])
+                stats["bytes_read"] += c.nbytes
+            stats["read_time"] += (timer() - t0) * 1e-9
+            if not _put_unless_stopped(queue, (i0, j0, a, b, c, last), stop):
+                return
+        _put_unless_stopped(queue, None, stop)
+    except Exception as e:
+        _put_unless_stopped(queue, e, stop)
 
 
-def time_dgemm_numpy(N):
-    A = np.ones((N, N))
-    B = 2 * np.ones((N, N))
-    C = np.zeros((N, N))
-    t0 = timer()
-    dgemm_numpy(A, B, C)
-    t1 = timer()
-    return t1 - t0
+def dgemm_memmap(A, B, C, tile=1024, prefetch=2):
+    """
+    C = C + A*B for matrices that do not fit in memory, e.g. np.memmap or
+    np.load(..., mmap_mode="r+") arrays. A (n x k), B (k x m) and C (n x m) are
+    streamed through memory in tile x tile blocks, a background thread reads up
+    to prefetch steps ahead while the current tiles are multiplied.
+    At most (2 + prefetch) * 3 tiles are held in memory.
+    Returns the statistics: bytes read and written, the time spent reading (in the
+    background thread), writing and multiplying and the wall time, see
+    print_memmap_stats.
+    """
+    n, k, m = _check_shapes(A, B, C)
+    stats = {"bytes_read": 0, "bytes_written": 0, "read_time": 0.0, "write_time": 0.0,
+             "compute_time": 0.0,
+             "flops": 2 * n * k * m}
+    queue = Queue(maxsize=prefetch)
+    stop = threading.Event()
+    t_start = timer()
+    loader = threading.Thread(target=_prefetch_tiles, args=(A, B, C, tile, queue, stats, stop), daemon=True)
+    loader.start()
+    c_tile = None
+    try:
+        while True:
+            item = queue.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            i0, j0, a, b, c, last = item
+            if c is not None:
+                c_tile = c
+            t0 = timer()
+            c_tile += a.dot(b)
+            stats["compute_time"] += (timer() - t0) * 1e-9
+            if last:
+                t0 = timer()
+                C[i0:i0 + tile, j0:j0 + tile] = c_tile
+                stats["bytes_written"] += c_tile.nbytes
+                stats["write_time"] += (timer() - t0) * 1e-9
+    finally:
+        # on an error the loader must not stay blocked on the full queue holding the tiles and memmaps
+        stop.set()
+        loader.join()
+    if hasattr(C, "flush"):
+        t0 = timer()
+        C.flush()
+        stats["write_time"] += (timer() - t0) * 1e-9
+    stats["wall_time"] = (timer() - t_start) * 1e-9
+    return stats
 
 
-def time_dgemm_numexpr(N):
-    A = np.ones((N, N))
-    B = 2 * np.ones((N, N))
-    C = np.zeros((N, N))
-    t0 = timer()
-    dgemm_numexpr(A, B, C)
-    t1 = timer()
-    return  t1 - t0
+def print_memmap_stats(stats):
+    io_bytes = stats["bytes_read"] + stats["bytes_written"]
+    io_time = stats["read_time"] + stats["write_time"]
+    print(f"I/O: {stats['bytes_read'] * 1e-9:.2f} GB read, {stats['bytes_written'] * 1e-9:.2f} GB written "
+          f"in {io_time:.3f} s, {io_bytes / io_time * 1e-9:.2f} GB/s")
+    print(f"compute: {stats['compute_time']:.3f} s, {stats['flops'] / stats['compute_time'] * 1e-9:.2f} GFLOP/s")
+    print(f"wall time {stats['wall_time']:.3f} s, {stats['flops'] / stats['wall_time'] * 1e-9:.2f} GFLOP/s overall "
+          f"(I/O and compute overlap when the sum exceeds the wall time)")
 
 
-def get_flops_dgemm(time_millis, N):
-    return 2 * N**3 * 1e3 / time_millis
+def memmap_report(N=4096, tile=1024, directory=None):
+    """dgemm_memmap on N x N matrices in .npy files in directory (a temporary one by default)"""
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        rng = np.random.default_rng(0)
+        matrices = []
+        for name in "ABC":
+            M = np.lib.format.open_memmap(os.path.join(tmp, name + ".npy"), mode="w+", shape=(N, N))
+            for i0 in range(0, N, tile):
+                M[i0:i0 + tile] = rng.random((min(tile, N - i0), N)) if name != "C" else 0.0
+            M.flush()
+            matrices.append(M)
+        print(f"out-of-core dgemm, N={N}, tile {tile}")
+        print_memmap_stats(dgemm_memmap(*matrices, tile=tile))
 
 
-# TODO: DRY! This code can cause potential eye damage.
-if __name__ == '__main__':
-    sizes = [16, 32, 64, 128, 192, 256, 320, 384, 448, 512] #[2**i for i in range(4, 10)]
-    means_list = []
-    var_list = []
-    means_array = []
-    var_array = []
-    means_np_array = []
-    var_np_array = []
-    means_ne_array = []
-    var_ne_array = []
+def strassen_workspace(n, k, m, cutoff=1024):
+    """
+    Preallocated buffers for dgemm_strassen with A (n x k) and B (k x m). One
+    entry per recursion level: the operand sums X (n/2 x k/2), Y (k/2 x m/2),
+    the product Z (n/2 x m/2) and, when k is odd, the peeling buffer of the
+    even part of the output. The first entry also holds the full product.
+    """
+    return [np.empty((n, m))] + [tuple(np.empty(shape) if shape is not None else None for shape in level)
+                                 for level in _strassen_shapes(n, k, m, cutoff)]
+
+
+def _strassen_shapes(n, k, m, cutoff):
+    """Shapes of the X, Y, Z and peeling buffers of every recursion level, None for no buffer"""
+    while min(n, k, m) > cutoff:
+        n2, k2, m2 = n // 2, k // 2, m // 2
+        yield (n2, k2), (k2, m2), (n2, m2), (2 * n2, 2 * m2) if k % 2 else None
+        n, k, m = n2, k2, m2
+
+
+def _workspace_shapes(workspace):
+    return [workspace[0].shape] + [tuple(b.shape if b is not None else None for b in level) for level in workspace[1:]]
+
+
+def _strassen(A, B, out, workspace, level, cutoff):
+    """out = A*B, Strassen-Winograd down to cutoff, the odd row/column/depth is peeled off"""
+    n, k = A.shape
+    m = B.shape[1]
+    if min(n, k, m) <= cutoff:
+        np.matmul(A, B, out=out)
+        return
+    X, Y, Z, peel = workspace[level]
+    n2, k2, m2 = n // 2, k // 2, m // 2
+    A11, A12, A21, A22 = A[:n2, :k2], A[:n2, k2:2*k2], A[n2:2*n2, :k2], A[n2:2*n2, k2:2*k2]
+    B11, B12, B21, B22 = B[:k2, :m2], B[:k2, m2:2*m2], B[k2:2*k2, :m2], B[k2:2*k2, m2:2*m2]
+    C11, C12, C21, C22 = out[:n2, :m2], out[:n2, m2:2*m2], out[n2:2*n2, :m2], out[n2:2*n2, m2:2*m2]
+
+    def mul(a, b, c):
+        _strassen(a, b, c, workspace, level + 1, cutoff)
+
+    # 7 products and 15 additions, the quadrants of out hold the intermediate results
+    np.subtract(A11, A21, out=X)    # S3
+    np.subtract(B22, B12, out=Y)    # T3
+    mul(X, Y, C21)                  # M7
+    np.add(A21, A22, out=X)         # S1
+    np.subtract(B12, B11, out=Y)    # T1
+    mul(X, Y, C22)                  # M5
+    np.subtract(X, A11, out=X)      # S2
+    np.subtract(B22, Y, out=Y)      # T2
+    mul(X, Y, C12)                  # M6
+    np.subtract(A12, X, out=X)      # S4
+    mul(X, B22, C11)                # M3
+    mul(A11, B11, Z)                # M1
+    np.add(C12, Z, out=C12)         # U2 = M1 + M6
+    np.add(C21, C12, out=C21)       # U3 = U2 + M7
+    np.add(C12, C22, out=C12)       # U4 = U2 + M5
+    np.add(C22, C21, out=C22)       # C22 = U3 + M5
+    np.add(C12, C11, out=C12)       # C12 = U4 + M3
+    np.subtract(Y, B21, out=Y)      # T4
+    mul(A22, Y, C11)                # M4
+    np.subtract(C21, C11, out=C21)  # C21 = U3 - M4
+    mul(A12, B21, C11)              # M2
+    np.add(C11, Z, out=C11)         # C11 = M1 + M2
+
+    # dynamic peeling of odd dimensions
+    if k % 2:
+        np.matmul(A[:2*n2, k - 1:], B[k - 1:, :2*m2], out=peel)
+        np.add(out[:2*n2, :2*m2], peel, out=out[:2*n2, :2*m2])
+    if m % 2:
+        np.matmul(A, B[:, m - 1:], out=out[:, m - 1:])
+    if n % 2:
+        np.matmul(A[n - 1:], B[:, :2*m2], out=out[n - 1:, :2*m2])
+
+
+def dgemm_strassen(A, B, C, cutoff=1024, workspace=None):
+    """
+    C = C + A*B with the Strassen-Winograd algorithm, 7 instead of 8 half size
+    products per level, O(N^2.81). Below cutoff (smallest of the three
+    dimensions) the products are done by BLAS. Sizes need not be powers of two,
+    odd dimensions are peeled off at every level. workspace from
+    strassen_workspace can be passed in to reuse it across calls, nothing else
+    is allocated by the recursion.
+    """
+    n, k, m = _check_shapes(A, B, C)
+    if workspace is None:
+        workspace = strassen_workspace(n, k, m, cutoff)
+    elif _workspace_shapes(workspace) != [(n, m)] + list(_strassen_shapes(n, k, m, cutoff)):
+        raise ValueError("workspace does not match the shapes and cutoff")
+    product = workspace[0]
+    _strassen(A, B, product, workspace, 1, cutoff)
+    np.add(C, product, out=C)
+
+
+def strassen_report(sizes=(1000, 2048, 3001), cutoffs=(256, 512, 1024)):
+    """Time and error of dgemm_strassen relative to A.dot(B), the error grows with
+    the number of recursion levels"""
+    rng = np.random.default_rng(0)
     for N in sizes:
-        print(N)
-        list_t = []
-        array_t = []
-        np_array_t = []
-        ne_array_t = []
-        for j in range(10):
-            list_t.append(time_dgemm_list(N))
-            array_t.append(time_dgemm_array(N))
-            np_array_t.append(time_dgemm_numpy(N))
-            ne_array_t.append(time_dgemm_numexpr(N))
-        x = np.array(list_t) * 1e-6 # We scale from ns to ms
-        means_list.append(x.mean())
-        var_list.append(x.std())
-        x = np.array(array_t) * 1e-6
-        means_array.append(x.mean())
-        var_array.append(x.std())
-        x = np.array(np_array_t) * 1e-6
-        means_np_array.append(x.mean())
-        var_np_array.append(x.std())
-        x = np.array(ne_array_t) * 1e-6
-        means_ne_array.append(x.mean())
-        var_ne_array.append(x.std())
-
-    # Execution time plots
-    fig, ax = plt.subplots()
-    ax.errorbar(sizes, means_list, yerr=var_list, label='python list', capsize=3)
-    ax.errorbar(sizes, means_array, yerr=var_array, label='python array', capsize=3)
-    ax.errorbar(sizes, means_np_array, yerr=var_np_array, label='numpy array', capsize=3)
-    ax.errorbar(sizes, means_ne_array, yerr=var_ne_array, label='numexpr & numpy ', capsize=3)
-    plt.legend()
-    plt.yscale("log")
-    plt.title("Matrix DGEMM execution times")
-    plt.ylabel("Execution time (milliseconds)")
-    plt.xlabel("Matrix dimension N")
-    plt.grid(which="both")
-    plt.show()
-
-    # FLOPS plot
-    fig, ax = plt.subplots()
-    ax.plot(sizes, [get_flops_dgemm(means_list[i], sizes[i]) for i in range(len(sizes))], label='python list')
-    ax.plot(sizes, [get_flops_dgemm(means_array[i], sizes[i]) for i in range(len(sizes))], label='python array')
-    ax.plot(sizes, [get_flops_dgemm(means_np_array[i], sizes[i]) for i in range(len(sizes))], label='numpy array')
-    ax.plot(sizes, [get_flops_dgemm(means_ne_array[i], sizes[i]) for i in range(len(sizes))], label='numexpr & numpy')
-    ax.plot(sizes, [5*1e9 for _ in range(len(sizes))], linestyle='dotted', label='theoretical peak (single core')
-    plt.legend()
-    plt.yscale("log")
-    plt.title("Matrix DGEMM FLOPS")
-    plt.ylabel("FLOPS")
-    plt.xlabel("Matrix dimension N")
-    plt.grid(which="both")
-    plt.show()
+        A = rng.standard_normal((N, N))
+        B = rng.standard_normal((N, N))
+        t0 = timer()
+        reference = A.dot(B)
+        t_blas = (timer() - t0) * 1e-9
+        print(f"N={N}, numpy {t_blas:.3f} s, {2 * N**3 / t_blas * 1e-9:.2f} GFLOP/s")
+        for cutoff in cutoffs:
+            workspace = strassen_workspace(N, N, N, cutoff)
+            C = np.zeros((N, N))
+            t0 = timer()
+            dgemm_strassen(A, B, C, cutoff, workspace)
+            t = (timer() - t0) * 1e-9
+            # relative to the size of the terms that are summed
+            error = np.abs(C - reference).max() / (np.abs(A).max() * np.abs(B).max() * N)
+            print(f"  cutoff {cutoff:>4}: {len(workspace) - 1} levels, {t:.3f} s, "
+                  f"speed-up {t_blas / t:.2f}, relative error {error:.2e}")
+
+
+def lists_dgemm(N):
+    return [1.0] * (N*N), [5.0] * (N*N), [0.0] * (N*N)
+
+
+def arrays_dgemm(N):
+    return array('d', [1.0] * (N*N)), array('d', [5.0] * (N*N)), array('d', [0.0] * (N*N))
+
+
+def np_arrays_dgemm(N):
+    return np.ones((N, N)), 2 * np.ones((N, N)), np.zeros((N, N))
+
+
+def dgemm_registry(block=64):
+    """The dgemm benchmark cases, block is the block size of dgemm_blocked"""
+    sizes = [16, 32, 64, 128, 192, 256, 320, 384, 448, 512]
+    large_sizes = [1024, 2048]
+    registry = Registry()
+
+    def flops(N):
+        return 2 * N**3
+
+    def add(kernel, backend, sizes, setup, fn):
+        registry.register(kernel, backend, sizes, setup, fn, flops, "FLOP")
+
+    add("dgemm", "list", sizes, lambda N: (*lists_dgemm(N), N), dgemm)
+    add("dgemm", "array", sizes, lambda N: (*arrays_dgemm(N), N), dgemm)
+    add("dgemm", "list-blocked", sizes, lambda N: (*lists_dgemm(N), N, block), dgemm_blocked)
+    add("dgemm", "array-blocked", sizes, lambda N: (*arrays_dgemm(N), N, block), dgemm_blocked)
+    add("dgemm", "numpy", sizes, np_arrays_dgemm, dgemm_numpy)
+    add("dgemm", "numexpr", sizes, np_arrays_dgemm, dgemm_numexpr)
+    if cython_dgemm is not None:
+        add("dgemm", "cython", sizes, np_arrays_dgemm, lambda A, B, C: cython_dgemm.dgemm(A, B, C, False))
+        add("dgemm", "cython-openmp", sizes, np_arrays_dgemm, lambda A, B, C: cython_dgemm.dgemm(A, B, C, True))
+    add("dgemm-large", "numpy", large_sizes, np_arrays_dgemm, dgemm_numpy)
+    add("dgemm-large", "strassen", large_sizes, np_arrays_dgemm, dgemm_strassen)
+    return registry
+
+
+if __name__ == '__main__':
+    parser = make_parser("DGEMM benchmarks", "dgemm_results.csv")
+    parser.add_argument("--block", type=int, help="dgemm_blocked block size, auto-tuned by default")
+    parser.add_argument("--reports", action="store_true", help="also run the Strassen and out-of-core reports")
+    args = parser.parse_args()
+    block = args.block
+    if block is None and not args.list and (args.backends is None or any("blocked" in b for b in args.backends)):
+        block, _ = tune_dgemm_blocked()
+        print("dgemm_blocked block size:", block)
+    run_benchmarks(dgemm_registry(block or 64), args)
+    # FLOP/s figure against the single core peak: python ../benchmarks/harness.py plot dgemm_results.csv \
+    #     --metric throughput --peak 5e9 --peak-label "theoretical peak (single core)" --out figures --name {kernel}_flops
+    if args.reports:
+        strassen_report()
+        memmap_report()
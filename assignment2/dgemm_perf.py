@@ -21,5 +21,6 @@ A = np.ones((N, N))
 B = 5.0 * np.ones((N, N))
 C = np.zeros((N, N))
 D = np.ones(66000) # cache flush
+# matrix product built from fused rank-1 updates, see dgemm_numexpr
 dgemm_numexpr(A, B, C)
 
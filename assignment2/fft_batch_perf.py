@@ -0,0 +1,37 @@
+"""
+Throughput of the threaded batch FFT (dft.fft_batch) for an increasing number of threads
+"""
+
+import os
+import sys
+import numpy as np
+from dft import fft, fft_batch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+from harness import Registry, make_parser, main as run_benchmarks
+
+
+def fft_batch_registry(batch, N, threads):
+    """
+    One case per engine and number of threads, the size of a case is its number
+    of threads. The signals and the output buffer are made once and shared by
+    all cases, the plans and twiddles are made in the warm-up run.
+    """
+    x = np.random.normal(0, 1, (batch, N)) + 1j * np.random.normal(0, 1, (batch, N))
+    out = np.empty_like(x)
+    registry = Registry()
+    for name, engine in (('dft.fft', fft), ('numpy.fft.fft', np.fft.fft)):
+        registry.register("fft_batch", name, threads, lambda n, engine=engine: (x, out, n, engine), fft_batch,
+                          lambda n: batch, "transforms")
+    return registry
+
+
+if __name__ == '__main__':
+    batch = 4096
+    N = 1024
+    threads = list(range(1, os.cpu_count() + 1))
+    args = make_parser(f"Batched FFT throughput, {batch} signals of length {N}",
+                       "fft_batch_results.csv").parse_args()
+    run_benchmarks(fft_batch_registry(batch, N, threads), args)
+    # throughput figure: python ../benchmarks/harness.py plot fft_batch_results.csv --metric throughput --linear \
+    #     --out figures --name fft_batch_throughput
@@ -0,0 +1,112 @@
+"""Multiprocess Julia set renderer.
+The grid is split into tiles of rows which are handed out one at a time to a
+process pool (dynamic scheduling), rows near the set take up to maxiter
+iterations while rows far from it escape almost at once so a static split
+would leave most workers idle. Every worker writes its tiles straight into a
+shared memory output buffer, nothing but small timing records is pickled back.
+"""
+import argparse
+import os
+from itertools import islice
+from multiprocessing import Pool, shared_memory
+from time import perf_counter as timer
+import numpy as np
+from JuliaSet import grid_axes, grid_shape, backends, c_real, c_imag
+
+# per process state, set up once by the pool initializer
+_worker = {}
+
+
+def _init_worker(shm_name, shape, x, max_iterations, backend):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker["shm"] = shm
+    _worker["output"] = np.ndarray(shape, dtype=np.int32, buffer=shm.buf)
+    _worker["x"] = np.array(x)
+    _worker["maxiter"] = max_iterations
+    _worker["kernel"] = backends[backend]
+
+
+def _render_tile(tile):
+    """Compute the tile of rows starting at row start with imaginary coordinates ys
+    into the shared output"""
+    start, ys = tile
+    t0 = timer()
+    x = _worker["x"]
+    zs = np.empty((len(ys), len(x)), dtype=np.complex128)
+    zs.real = x[np.newaxis, :]
+    zs.imag = np.array(ys)[:, np.newaxis]
+    output = _worker["kernel"](_worker["maxiter"], zs.ravel(), complex(c_real, c_imag))
+    _worker["output"][start:start + len(ys)] = np.reshape(output, zs.shape)
+    return os.getpid(), len(ys), timer() - t0
+
+
+def make_tiles(y, rows_per_tile):
+    """Lazily group the imaginary axis y into (first row, ys) tiles"""
+    start = 0
+    while True:
+        ys = tuple(islice(y, rows_per_tile))
+        if not ys:
+            return
+        yield start, ys
+        start += len(ys)
+
+
+def render_parallel(desired_width, max_iterations, n_workers=None, rows_per_tile=8, backend="numpy"):
+    """
+    Render the Julia set on n_workers processes, returns the (rows, columns)
+    iteration count array and per worker statistics {pid: [tiles, rows, busy seconds]}
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count()
+    shape = grid_shape(desired_width)
+    x, y = grid_axes(desired_width)
+    x = list(x)
+    nbytes = shape[0] * shape[1] * np.dtype(np.int32).itemsize
+    shm = shared_memory.SharedMemory(create=True, size=nbytes)
+    try:
+        stats = {}
+        with Pool(n_workers, initializer=_init_worker,
+                  initargs=(shm.name, shape, x, max_iterations, backend)) as pool:
+            # chunksize=1: an idle worker grabs the next tile as soon as it is done
+            for pid, rows, busy in pool.imap_unordered(_render_tile, make_tiles(y, rows_per_tile), chunksize=1):
+                record = stats.setdefault(pid, [0, 0, 0.0])
+                record[0] += 1
+                record[1] += rows
+                record[2] += busy
+        output = np.ndarray(shape, dtype=np.int32, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+    return output, stats
+
+
+def print_load_balance(stats):
+    busy = np.array([record[2] for record in stats.values()])
+    for pid, (tiles, rows, seconds) in sorted(stats.items()):
+        print(f"worker {pid}: {tiles} tiles, {rows} rows, busy {seconds:.3f} s ({100 * seconds / busy.sum():.1f}%)")
+    # 1.0 means perfectly balanced
+    print(f"load imbalance (max/mean busy time): {busy.max() / busy.mean():.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel Julia set speed-up measurement")
+    parser.add_argument("--width", type=int, default=10000)
+    parser.add_argument("--max-iterations", type=int, default=300)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="largest number of workers")
+    parser.add_argument("--rows-per-tile", type=int, default=8)
+    parser.add_argument("--backend", default="numpy", choices=sorted(backends))
+    args = parser.parse_args()
+
+    n_workers = sorted({2**i for i in range(args.workers.bit_length()) if 2**i <= args.workers} | {args.workers})
+    base_time = None
+    for n in n_workers:
+        t0 = timer()
+        output, stats = render_parallel(args.width, args.max_iterations, n, args.rows_per_tile, args.backend)
+        elapsed = timer() - t0
+        if base_time is None:
+            base_time = elapsed
+        speedup = base_time / elapsed
+        print(f"{n} workers: {elapsed:.3f} s, speed-up {speedup:.2f}, efficiency {speedup / n:.2f}")
+        print_load_balance(stats)
+        if args.width == 1000 and args.max_iterations == 300:
+            assert output.sum() == 33219980
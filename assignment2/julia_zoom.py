@@ -0,0 +1,166 @@
+"""Zoomable Julia set renderer with a tile cache.
+The plane is covered by lattices of points (i * step, j * step) with
+step = base_step / 2**level, every zoom level halves the step. A lattice is cut
+into square tiles of tile_size x tile_size points, the iteration state (z, n) of
+every tile computed is kept in an LRU cache under a memory budget so that
+- rendering a region again is a cache hit,
+- raising maxiter continues the stored tiles from z and n instead of restarting,
+- a tile at level L + 1 takes its even points from the cached parent tile at level L,
+  2i * (step / 2) == i * step exactly so these points are the same bit for bit
+  and only 3/4 of the refined tile has to be computed.
+"""
+import argparse
+from collections import OrderedDict
+from math import ceil, floor
+from time import perf_counter as timer
+import numpy as np
+from JuliaSet import calculate_z_numpy_resume, x1, x2, c_real, c_imag
+
+
+class TileState:
+    def __init__(self, z, n, maxiter):
+        self.z = z
+        self.n = n
+        self.maxiter = maxiter
+
+    @property
+    def nbytes(self):
+        return self.z.nbytes + self.n.nbytes
+
+
+class TileCache:
+    """LRU cache of TileStates, the least recently used tiles are evicted when the
+    cached states take up more than max_bytes"""
+    def __init__(self, max_bytes=256 * 2**20):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._tiles = OrderedDict()
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def get(self, key):
+        state = self._tiles.get(key)
+        if state is not None:
+            self._tiles.move_to_end(key)
+        return state
+
+    def put(self, key, state):
+        if key in self._tiles:
+            self.nbytes -= self._tiles.pop(key).nbytes
+        if state.nbytes > self.max_bytes:
+            return
+        self._tiles[key] = state
+        self.nbytes += state.nbytes
+        while self.nbytes > self.max_bytes:
+            _, evicted = self._tiles.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+
+class ZoomRenderer:
+    def __init__(self, c=complex(c_real, c_imag), base_step=(x2 - x1) / 1000, tile_size=128, cache=None):
+        assert tile_size % 2 == 0, "tile_size must be even to line up with the parent tiles"
+        self.c = c
+        self.base_step = base_step
+        self.tile_size = tile_size
+        self.cache = TileCache() if cache is None else cache
+        # counts of how every tile request was served
+        self.stats = {"hit": 0, "resumed": 0, "seeded": 0, "computed": 0}
+
+    def step(self, level):
+        return self.base_step / 2**level
+
+    def _key(self, level, ti, tj):
+        # the cache can be shared between renderers, c and the lattice are part of the key
+        return self.c, self.base_step, self.tile_size, level, ti, tj
+
+    def tile(self, level, ti, tj, maxiter):
+        """Escape counts of tile (ti, tj) at level, indexed [j, i] with the imaginary
+        lattice index j increasing along the first axis"""
+        key = self._key(level, ti, tj)
+        state = self.cache.get(key)
+        if state is not None and state.maxiter >= maxiter:
+            self.stats["hit"] += 1
+            # counts are min(escape time, maxiter) so a deeper tile answers a shallower query
+            return np.minimum(state.n, maxiter)
+        if state is not None:
+            self.stats["resumed"] += 1
+            calculate_z_numpy_resume(maxiter, state.z, state.n, self.c)
+            state.maxiter = maxiter
+            self.cache.put(key, state)
+            # a copy like on a hit, the caller must not be able to change the cached state
+            return state.n.copy()
+
+        ts = self.tile_size
+        step = self.step(level)
+        i = np.arange(ti * ts, (ti + 1) * ts)
+        j = np.arange(tj * ts, (tj + 1) * ts)
+        z = np.empty((ts, ts), dtype=np.complex128)
+        z.real = (i * step)[np.newaxis, :]
+        z.imag = (j * step)[:, np.newaxis]
+        n = np.zeros((ts, ts), dtype=np.int32)
+        parent = self.cache.get(self._key(level - 1, ti // 2, tj // 2))
+        if parent is not None and parent.maxiter <= maxiter:
+            self.stats["seeded"] += 1
+            half = ts // 2
+            rows = slice((tj % 2) * half, (tj % 2 + 1) * half)
+            columns = slice((ti % 2) * half, (ti % 2 + 1) * half)
+            z[::2, ::2] = parent.z[rows, columns]
+            n[::2, ::2] = parent.n[rows, columns]
+        else:
+            self.stats["computed"] += 1
+        calculate_z_numpy_resume(maxiter, z, n, self.c)
+        self.cache.put(key, TileState(z, n, maxiter))
+        return n.copy()
+
+    def render(self, area, level, maxiter):
+        """
+        Render the lattice points of level inside area = (x1, x2, y1, y2), returns
+        the escape counts with the top row (largest imaginary part) first like calc_pure_python
+        """
+        ax1, ax2, ay1, ay2 = area
+        step = self.step(level)
+        ts = self.tile_size
+        i0, i1 = ceil(ax1 / step), floor(ax2 / step)
+        j0, j1 = ceil(ay1 / step), floor(ay2 / step)
+        output = np.empty((j1 - j0 + 1, i1 - i0 + 1), dtype=np.int32)
+        for tj in range(j0 // ts, j1 // ts + 1):
+            for ti in range(i0 // ts, i1 // ts + 1):
+                n = self.tile(level, ti, tj, maxiter)
+                # overlap of the tile with the requested index range
+                ja, jb = max(j0, tj * ts), min(j1 + 1, (tj + 1) * ts)
+                ia, ib = max(i0, ti * ts), min(i1 + 1, (ti + 1) * ts)
+                output[ja - j0:jb - j0, ia - i0:ib - i0] = n[ja - tj * ts:jb - tj * ts, ia - ti * ts:ib - ti * ts]
+        return output[::-1]
+
+
+def zoom_areas(center, half_width, levels):
+    """The area around center of every zoom level, halved in size per level"""
+    areas = []
+    for level in range(levels):
+        h = half_width / 2**level
+        areas.append((center.real - h, center.real + h, center.imag - h, center.imag + h))
+    return areas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Julia set zoom with a tile cache")
+    parser.add_argument("--levels", type=int, default=5)
+    parser.add_argument("--max-iterations", type=int, default=300)
+    parser.add_argument("--cache-mb", type=int, default=256)
+    args = parser.parse_args()
+
+    renderer = ZoomRenderer(cache=TileCache(args.cache_mb * 2**20))
+    areas = zoom_areas(complex(-0.3, 0.2), (x2 - x1) / 2, args.levels)
+    # zoom in raising maxiter, then go back out the same way and finally deeper at every level
+    passes = [("zoom in", 1), ("zoom out", 1), ("deeper", 2)]
+    for name, depth in passes:
+        levels = range(args.levels) if name != "zoom out" else reversed(range(args.levels))
+        for level in levels:
+            maxiter = depth * args.max_iterations * (level + 1)
+            t0 = timer()
+            output = renderer.render(areas[level], level, maxiter)
+            elapsed = timer() - t0
+            print(f"{name}: level {level}, {output.shape[1]}x{output.shape[0]} points, maxiter {maxiter}: "
+                  f"{elapsed:.3f} s, {renderer.stats}")
+    print(f"cache: {len(renderer.cache)} tiles, {renderer.cache.nbytes / 2**20:.1f} MB")
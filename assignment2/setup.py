@@ -0,0 +1,15 @@
+"""
+Setup file for cython DGEMM, built with OpenMP for the parallel version
+"""
+
+from distutils.core import setup
+from distutils.extension import Extension
+from Cython.Build import cythonize
+import numpy
+
+
+extensions = [Extension("cython_dgemm", ["cython_dgemm.pyx"],
+                        extra_compile_args=["-O3", "-march=native", "-fopenmp"], extra_link_args=["-fopenmp"])]
+
+setup(ext_modules=cythonize(extensions,
+                            compiler_directives={"language_level": "3"}), include_dirs=[numpy.get_include()])
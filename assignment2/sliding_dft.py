@@ -0,0 +1,93 @@
+"""
+Streaming spectra of continuous signals built on the dft.py routines.
+SlidingDFT updates the spectrum of the last N samples in O(N) per new sample,
+stft transforms a window every hop samples with dft.fft in O(N log N) per hop.
+Samples come in through any iterable (e.g. a generator), they are kept in a
+ring buffer of N samples and the frames are produced lazily, memory does not
+grow with the length of the stream.
+"""
+
+import numpy as np
+from time import perf_counter_ns as timer
+from dft import fft
+
+
+class SlidingDFT:
+    """
+    Spectrum of the last N samples, oldest sample first like fft(window).
+    A new sample x_new replacing x_old updates every bin with
+    X_k <- (X_k - x_old + x_new) exp(2 pi i k / N).
+    The recurrence slowly accumulates rounding errors, so after every resync
+    updates the spectrum is recomputed from the ring buffer with fft.
+    """
+    def __init__(self, N, resync=None):
+        self.N = N
+        self.resync = N if resync is None else resync
+        self.buffer = np.zeros(N, dtype=np.complex128)
+        self.pos = 0    # index of the oldest sample in the ring buffer
+        self.X = np.zeros(N, dtype=np.complex128)
+        self.rotation = np.exp(2j * np.pi * np.arange(N) / N)
+        self._since_resync = 0
+
+    def window(self):
+        """The last N samples, oldest first"""
+        return np.roll(self.buffer, -self.pos)
+
+    def update(self, sample):
+        old = self.buffer[self.pos]
+        self.buffer[self.pos] = sample
+        self.pos = (self.pos + 1) % self.N
+        self._since_resync += 1
+        if self._since_resync >= self.resync:
+            self.X = fft(self.window())
+            self._since_resync = 0
+        else:
+            self.X += sample - old
+            self.X *= self.rotation
+        return self.X
+
+
+def sliding_dft(samples, N, resync=None):
+    """Yield the spectrum of the last N samples for every sample once N have arrived"""
+    sdft = SlidingDFT(N, resync)
+    for i, sample in enumerate(samples):
+        X = sdft.update(sample)
+        if i >= N - 1:
+            yield X.copy()
+
+
+def stft(samples, N, hop, window=None):
+    """
+    Short-time Fourier transform, yield fft(window * frame) for frames of N samples
+    starting every hop samples, window defaults to a Hann window
+    """
+    if window is None:
+        window = np.hanning(N)
+    buffer = np.zeros(N, dtype=np.complex128)
+    pos = 0
+    for i, sample in enumerate(samples):
+        buffer[pos] = sample
+        pos = (pos + 1) % N
+        if i >= N - 1 and (i - N + 1) % hop == 0:
+            yield fft(window * np.roll(buffer, -pos))
+
+
+def chirp(f0=10.0, f1=1000.0, rate=8000, duration=1.0):
+    """Generator of a linear chirp sampled at rate Hz"""
+    n_samples = int(rate * duration)
+    for i in range(n_samples):
+        t = i / rate
+        yield np.exp(2j * np.pi * (f0 * t + 0.5 * (f1 - f0) / duration * t * t))
+
+
+if __name__ == '__main__':
+    N = 256
+    # the stft with hop 1 and a rectangular window recomputes the sliding spectrum with an fft per sample
+    runs = (("sliding DFT", sliding_dft(chirp(), N)),
+            ("fft per sample", stft(chirp(), N, 1, window=np.ones(N))),
+            ("stft, hop N/4", stft(chirp(), N, N // 4)))
+    for name, frames in runs:
+        t0 = timer()
+        n_frames = sum(1 for _ in frames)
+        elapsed = (timer() - t0) * 1e-9
+        print(f"{name}: {n_frames} frames in {elapsed:.3f} s, {n_frames / elapsed:.0f} frames/s")
@@ -3,8 +3,11 @@ Author: Johan Ericsson
 Date: 2022-03-13
 """
 
+from collections import OrderedDict
 import numpy as np
-from assignment2.dft import DFT, DFT2
+import pytest
+import assignment2.dft as dft
+from assignment2.dft import DFT, DFT2, DFT3, FFT, fft, fft_batch, dft_matmul
 
 
 def test_dft(N=1024):
@@ -46,3 +49,87 @@ def test_dft2(N=1024):
 
     np.testing.assert_almost_equal(Xre, Xref.real, decimal=10, err_msg="Error real parts differ")
     np.testing.assert_almost_equal(Xim, Xref.imag, decimal=10, err_msg="Error imaginary parts differ")
+
+
+def test_dft3(N=1024):
+    # Test signal a complex wave
+    t = np.linspace(0, 1, N)
+    s = np.random.normal(0, 0.1, N)
+    xre = [np.sin(2 * np.pi * ti) + si for ti, si in zip(t, s)]
+    xim = [np.cos(2 * np.pi * ti) + si for ti, si in zip(t, s)]
+
+    # DFT calculation
+    Xre = [0 for _ in range(N)]
+    Xim = [0 for _ in range(N)]
+    DFT3(xre, xim, Xre, Xim)
+
+    # numpy.fft reference
+    x = np.array(xre) + np.array(xim) * 1j
+    Xref = np.fft.fft(x)
+
+    np.testing.assert_almost_equal(Xre, Xref.real, decimal=10, err_msg="Error real parts differ")
+    np.testing.assert_almost_equal(Xim, Xref.imag, decimal=10, err_msg="Error imaginary parts differ")
+
+
+def test_fft(N=1024):
+    # Test signal a complex wave
+    t = np.linspace(0, 1, N)
+    s = np.random.normal(0, 0.1, N)
+    xre = [np.sin(2 * np.pi * ti) + si for ti, si in zip(t, s)]
+    xim = [np.cos(2 * np.pi * ti) + si for ti, si in zip(t, s)]
+
+    # FFT calculation
+    Xre = [0 for _ in range(N)]
+    Xim = [0 for _ in range(N)]
+    FFT(xre, xim, Xre, Xim)
+
+    # numpy.fft reference
+    x = np.array(xre) + np.array(xim) * 1j
+    Xref = np.fft.fft(x)
+
+    np.testing.assert_almost_equal(Xre, Xref.real, decimal=10, err_msg="Error real parts differ")
+    np.testing.assert_almost_equal(Xim, Xref.imag, decimal=10, err_msg="Error imaginary parts differ")
+
+
+def test_fft_bluestein():
+    # Non power of two lengths go through Bluestein's algorithm, also for a batch of signals
+    for N in [1, 3, 7, 100, 1000]:
+        x = np.random.normal(0, 1, (4, N)) + 1j * np.random.normal(0, 1, (4, N))
+        np.testing.assert_almost_equal(fft(x), np.fft.fft(x), decimal=10, err_msg="Error fft differs for N=%d" % N)
+
+
+def test_fft_plan_cache(monkeypatch):
+    # room for the plans of a few sizes only, a stream of distinct Bluestein sizes must not grow the cache
+    monkeypatch.setattr(dft, "FFT_PLAN_CACHE_BYTES", 64 * 2**10)
+    monkeypatch.setattr(dft, "_fft_plans", OrderedDict())
+    for N in range(100, 400, 7):
+        x = np.random.normal(0, 1, N) + 0j
+        np.testing.assert_almost_equal(fft(x), np.fft.fft(x), decimal=10)
+        assert sum(plan.nbytes for plan in dft._fft_plans.values()) <= dft.FFT_PLAN_CACHE_BYTES
+
+
+def test_fft_batch(N=256, batch=37):
+    # Batch sharded over more threads than fit evenly, written to a preallocated buffer
+    x = np.random.normal(0, 1, (batch, N)) + 1j * np.random.normal(0, 1, (batch, N))
+    out = np.empty_like(x)
+    X = fft_batch(x, out, n_threads=4)
+    assert X is out
+    np.testing.assert_almost_equal(X, np.fft.fft(x), decimal=10, err_msg="Error batched fft differs")
+    with pytest.raises(ValueError):
+        fft_batch(x[0], n_threads=4)
+
+
+def test_dft_matmul(N=1024, batch=8):
+    # Batch of test signals, complex waves with different noise
+    t = np.linspace(0, 1, N)
+    s = np.random.normal(0, 0.1, (batch, N))
+    x = np.sin(2 * np.pi * t) + s + 1j * (np.cos(2 * np.pi * t) + s)
+
+    # DFT calculation
+    X = dft_matmul(x)
+
+    # numpy.fft reference
+    Xref = np.fft.fft(x)
+
+    np.testing.assert_almost_equal(X.real, Xref.real, decimal=10, err_msg="Error real parts differ")
+    np.testing.assert_almost_equal(X.imag, Xref.imag, decimal=10, err_msg="Error imaginary parts differ")
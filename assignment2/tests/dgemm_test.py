@@ -2,9 +2,10 @@
 Author: Johan Ericsson
 Date: 2022-02-14
 """
+import threading
 import numpy as np
 import pytest
-from dgemm import dgemm, dgemm_numpy
+from dgemm import dgemm, dgemm_blocked, dgemm_memmap, dgemm_numexpr, dgemm_numpy, dgemm_strassen, strassen_workspace
 
 
 def test_dgemm():
@@ -23,6 +24,22 @@ def test_dgemm():
         assert C[i] == result, "dgemm result is wrong"
 
 
+def test_dgemm_blocked():
+    """
+    The blocked version adds the k terms in the same order as dgemm so the results must be equal,
+    N is not a multiple of the block size to cover the partial blocks.
+    """
+    N = 70
+    rng = np.random.default_rng(0)
+    A = list(rng.random(N*N))
+    B = list(rng.random(N*N))
+    C = list(rng.random(N*N))
+    C_ref = list(C)
+    dgemm(A, B, C_ref, N)
+    dgemm_blocked(A, B, C, N, block=16)
+    assert C == C_ref, "dgemm_blocked result is wrong"
+
+
 def test_dgemm_numpy():
     N = 512
     A = np.ones((N, N))
@@ -31,3 +48,88 @@ def test_dgemm_numpy():
     dgemm_numpy(A, B, C)
     result = np.ones((N,N))*5.0*N
     np.testing.assert_array_equal(C, result, "dgemm result is wrong")
+
+
+@pytest.mark.parametrize("depth", [1, 8, 15])
+def test_dgemm_numexpr(depth):
+    # a matrix product, not the element-wise C + A*B, k is not a multiple of depth
+    n, k, m = 40, 53, 31
+    rng = np.random.default_rng(0)
+    A = rng.random((n, k))
+    B = rng.random((k, m))
+    C = rng.random((n, m))
+    result = C + A.dot(B)
+    dgemm_numexpr(A, B, C, depth)
+    np.testing.assert_allclose(C, result, rtol=1e-12, err_msg="dgemm result is wrong")
+
+
+@pytest.mark.parametrize("shapes", [((40, 32), (34, 40), (40, 40)), ((40, 32), (32, 40), (40, 41))])
+def test_dgemm_numexpr_shapes(shapes):
+    A, B, C = (np.ones(shape) for shape in shapes)
+    with pytest.raises(ValueError):
+        dgemm_numexpr(A, B, C)
+
+
+@pytest.mark.parametrize("n, k, m", [(64, 64, 64), (97, 101, 99), (33, 16, 47)])
+def test_dgemm_strassen(n, k, m):
+    # a small cutoff for several recursion levels, odd sizes are peeled
+    rng = np.random.default_rng(0)
+    A = rng.random((n, k))
+    B = rng.random((k, m))
+    C = rng.random((n, m))
+    result = C + A.dot(B)
+    dgemm_strassen(A, B, C, cutoff=4)
+    np.testing.assert_allclose(C, result, rtol=1e-12, err_msg="dgemm result is wrong")
+
+
+def test_dgemm_strassen_shapes():
+    A, B, C = np.ones((40, 32)), np.ones((34, 40)), np.zeros((40, 40))
+    with pytest.raises(ValueError):
+        dgemm_strassen(A, B, C, cutoff=4)
+    # a workspace made for other shapes or another cutoff
+    A, B = np.ones((40, 33)), np.ones((33, 40))
+    for workspace in (strassen_workspace(40, 32, 40, cutoff=4), strassen_workspace(40, 33, 40, cutoff=8)):
+        with pytest.raises(ValueError):
+            dgemm_strassen(A, B, C, cutoff=4, workspace=workspace)
+    dgemm_strassen(A, B, C, cutoff=4, workspace=strassen_workspace(40, 33, 40, cutoff=4))
+    np.testing.assert_allclose(C, A.dot(B), rtol=1e-12)
+
+
+def test_dgemm_memmap(tmp_path):
+    # tiles that do not divide the sizes, an odd number of C tile columns for the back and forth k order
+    n, k, m = 50, 70, 45
+    rng = np.random.default_rng(0)
+    matrices = []
+    for name, shape in (("A", (n, k)), ("B", (k, m)), ("C", (n, m))):
+        M = np.lib.format.open_memmap(tmp_path / (name + ".npy"), mode="w+", shape=shape)
+        M[:] = rng.random(shape)
+        matrices.append(M)
+    A, B, C = matrices
+    result = C + A.dot(B)
+    stats = dgemm_memmap(A, B, C, tile=16)
+    np.testing.assert_allclose(np.load(tmp_path / "C.npy"), result, rtol=1e-12, err_msg="dgemm result is wrong")
+    assert stats["bytes_written"] == C.nbytes
+
+
+def test_dgemm_memmap_errors():
+    with pytest.raises(ValueError):
+        dgemm_memmap(np.ones((4, 2)), np.ones((4, 4)), np.zeros((4, 4)), tile=2)
+    # an integer C cannot take the float update, the loader thread must stop instead of blocking
+    threads = threading.active_count()
+    with pytest.raises(TypeError):
+        dgemm_memmap(np.ones((64, 64)), np.ones((64, 64)), np.zeros((64, 64), dtype=np.int64), tile=8, prefetch=1)
+    assert threading.active_count() == threads
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_dgemm_cython(parallel):
+    cython_dgemm = pytest.importorskip("cython_dgemm")
+    # sizes that are not multiples of the register and cache blocks
+    n, k, m = 130, 300, 67
+    rng = np.random.default_rng(0)
+    A = rng.random((n, k))
+    B = rng.random((k, m))
+    C = rng.random((n, m))
+    result = C + A.dot(B)
+    cython_dgemm.dgemm(A, B, C, parallel)
+    np.testing.assert_allclose(C, result, rtol=1e-12, err_msg="dgemm result is wrong")
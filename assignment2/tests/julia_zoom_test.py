@@ -0,0 +1,52 @@
+import numpy as np
+from JuliaSet import calculate_z_numpy
+from julia_zoom import TileCache, ZoomRenderer
+
+
+def reference(renderer, level, ti, tj, maxiter):
+    """The escape counts of a tile computed directly on its lattice points"""
+    ts = renderer.tile_size
+    step = renderer.step(level)
+    i = np.arange(ti * ts, (ti + 1) * ts)
+    j = np.arange(tj * ts, (tj + 1) * ts)
+    z = (i * step)[np.newaxis, :] + 1j * (j * step)[:, np.newaxis]
+    return calculate_z_numpy(maxiter, z.ravel(), renderer.c).reshape(ts, ts)
+
+
+def test_zoom_renderer():
+    renderer = ZoomRenderer(base_step=0.05, tile_size=8)
+    # computed, hit with a lower maxiter, resumed with a higher one, seeded from the parent
+    steps = [(0, -1, -1, 50, "computed"), (0, -1, -1, 20, "hit"), (0, -1, -1, 80, "resumed"),
+             (1, -2, -1, 120, "seeded")]
+    for level, ti, tj, maxiter, path in steps:
+        before = dict(renderer.stats)
+        n = renderer.tile(level, ti, tj, maxiter)
+        assert renderer.stats[path] == before[path] + 1
+        np.testing.assert_array_equal(n, reference(renderer, level, ti, tj, maxiter))
+        # the result is a copy, changing it does not change the cache
+        n[:] = -1
+        np.testing.assert_array_equal(renderer.tile(level, ti, tj, maxiter),
+                                      reference(renderer, level, ti, tj, maxiter))
+
+
+def test_render():
+    # the rendered region against a direct computation on the same lattice points
+    renderer = ZoomRenderer(base_step=0.05, tile_size=8)
+    output = renderer.render((-0.52, 0.31, -0.4, 0.25), 0, 60)
+    i = np.arange(-10, 7)
+    j = np.arange(-8, 6)[::-1]
+    z = (i * 0.05)[np.newaxis, :] + 1j * (j * 0.05)[:, np.newaxis]
+    np.testing.assert_array_equal(output, calculate_z_numpy(60, z.ravel(), renderer.c).reshape(z.shape))
+
+
+def test_eviction():
+    # room for two 8x8 tiles (16 B z and 4 B n per point)
+    cache = TileCache(max_bytes=2 * 64 * 20)
+    renderer = ZoomRenderer(base_step=0.05, tile_size=8, cache=cache)
+    for ti in range(3):
+        renderer.tile(0, ti, 0, 30)
+    assert len(cache) == 2 and cache.nbytes <= cache.max_bytes
+    # the first tile was evicted and is computed again, the last one is still cached
+    renderer.tile(0, 0, 0, 30)
+    renderer.tile(0, 2, 0, 30)
+    assert renderer.stats == {"hit": 1, "resumed": 0, "seeded": 0, "computed": 4}
@@ -0,0 +1,28 @@
+"""
+Tests of the streaming spectra in sliding_dft.py
+"""
+import numpy as np
+from sliding_dft import sliding_dft, stft
+
+
+def test_sliding_dft(N=64):
+    # Test stream a noisy complex wave, every spectrum is compared with the fft of its window
+    n = 1000
+    t = np.linspace(0, 1, n)
+    s = np.random.normal(0, 0.1, n)
+    x = np.sin(2 * np.pi * t) + s + 1j * (np.cos(2 * np.pi * t) + s)
+    frames = list(sliding_dft(iter(x), N))
+    assert len(frames) == n - N + 1
+    for i, X in enumerate(frames):
+        np.testing.assert_almost_equal(X, np.fft.fft(x[i:i + N]), decimal=10, err_msg="sliding DFT differs")
+
+
+def test_stft(N=64, hop=16):
+    n = 1000
+    x = np.random.normal(0, 1, n) + 1j * np.random.normal(0, 1, n)
+    window = np.hanning(N)
+    frames = list(stft(iter(x), N, hop))
+    assert len(frames) == (n - N) // hop + 1
+    for i, X in enumerate(frames):
+        np.testing.assert_almost_equal(X, np.fft.fft(window * x[i * hop:i * hop + N]), decimal=10,
+                                       err_msg="stft frame differs")
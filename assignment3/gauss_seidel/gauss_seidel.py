@@ -2,11 +2,17 @@
 Gauss-Seidel For Poisson Solver
 """
 
+import os
+import sys
 import numpy as np
-from time import perf_counter_ns as timer
-import matplotlib.pyplot as plt
-from matplotlib import rcParams
-import cython_gs
+try:
+    # compiled with python setup.py build_ext --inplace
+    import cython_gs
+except ImportError:
+    cython_gs = None
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "benchmarks"))
+from harness import Registry, make_parser, main as run_benchmarks
 
 
 def gauss_seidel(f):
@@ -29,101 +35,37 @@ def gauss_seidel_pycollection(f):
     return newf
 
 
-def benchmark_list(grid_size: tuple, iterations=1000):
-    # initialisation of f
-    f = []
-    for i in range(grid_size[0]):
-        row = [0.5] * grid_size[1]
-        f.append(row)
-    # timing
-    t0 = timer()
-    for _ in range(iterations):
-        f = gauss_seidel_pycollection(f)
-    time = timer()-t0
-
-    return time
+def grid_list(n):
+    return [[0.5] * n for _ in range(n)]
 
 
-def benchmark_numpy(grid_size: tuple, iterations=1000):
-    # initialisation of f
-    f = np.ones(shape=(grid_size))
-    # timing
-    t0 = timer()
-    for _ in range(iterations):
-        f = gauss_seidel(f)
-    time = timer() - t0
+def grid_numpy(n):
+    return np.ones(shape=(n, n))
 
-    return time
 
-
-def benchmark_list_cython(grid_size: tuple, iterations=1000):
-    # initialisation of f
-    f = []
-    for i in range(grid_size[0]):
-        row = [0.5] * grid_size[1]
-        f.append(row)
-    # timing
-    t0 = timer()
+def run_sweeps(update, f, iterations):
     for _ in range(iterations):
-        f = cython_gs.gauss_seidel_pycollection(f)
-    time = timer()-t0
-
-    return time
+        f = update(f)
+    return f
 
 
-def benchmark_numpy_cython(grid_size: tuple, iterations=1000):
-    # initialisation of f
-    f = np.ones(shape=(grid_size))
-    # timing
-    t0 = timer()
-    for _ in range(iterations):
-        f = cython_gs.gauss_seidel(f)
-    time = timer() - t0
+def gauss_seidel_registry(N, iterations=1000):
+    """Cases of iterations Gauss-Seidel sweeps on N x N grids, 4 FLOP per interior point"""
+    registry = Registry()
+    backends = [("list", gauss_seidel_pycollection, grid_list), ("numpy", gauss_seidel, grid_numpy)]
+    if cython_gs is not None:
+        backends += [("list (cython)", cython_gs.gauss_seidel_pycollection, grid_list),
+                     ("numpy (cython)", cython_gs.gauss_seidel, grid_numpy)]
+    for backend, update, grid in backends:
+        registry.register("gauss_seidel", backend, N, lambda n, u=update, g=grid: (u, g(n), iterations), run_sweeps,
+                          lambda n: 4 * (n - 2)**2 * iterations, "FLOP")
+    return registry
 
-    return time
 
 if __name__ == '__main__':
-    plot = True
     N = [8, 16, 32, 64, 128, 256]
-    grid_sizes = [(n, n) for n in N]
-    list_timings = []
-    np_timings = []
-    list_timings_cython = []
-    np_timings_cython = []
-    for grid_size in grid_sizes:
-        # list timing
-        t = benchmark_list(grid_size)
-        list_timings.append(t)
-        # np timing
-        t = benchmark_numpy(grid_size)
-        np_timings.append(t)
-        # list cython timing
-        t = benchmark_list_cython(grid_size)
-        list_timings_cython.append(t)
-        # np timing
-        t = benchmark_numpy_cython(grid_size)
-        np_timings_cython.append(t)
-
-    print(N)
-    print(list_timings)
-    print(np_timings)
-
-    if plot:
-        rcParams.update({'font.size': 20})
-
-        fig, ax = plt.subplots(figsize=(16, 10))
-        title = 'Gauss Seidel Execution time'
-        ax.set_xlabel("Grid size, $N$ ")
-        ax.set_ylabel("Exection Time (ns)")
-        ax.set(yscale="log")
-        plt.grid(True, which="both")
-        ax.plot(N, list_timings, "o:", linewidth=2.0, label="list", color='r')
-        ax.plot(N, np_timings, "o:", linewidth=2.0, label="numpy array", color='b')
-        ax.plot(N, list_timings_cython, "^:", linewidth=2.0, label="list (cython)", color='r')
-        ax.plot(N, np_timings_cython, "^:", linewidth=2.0, label="numpy array (cython)", color='b')
-        ax.legend()
-        ax.set_xticks(N, minor=True)
-        fig.suptitle(title)
-        fig.tight_layout()
-        plt.show()
-        fig.savefig("figures/gauss_seidel.pdf", format="pdf")
+    parser = make_parser("Gauss-Seidel benchmark", "gauss_seidel_results.csv")
+    parser.add_argument("--iterations", type=int, default=1000, help="sweeps per run")
+    args = parser.parse_args()
+    run_benchmarks(gauss_seidel_registry(N, args.iterations), args)
+    # execution time figure: python ../../benchmarks/harness.py plot gauss_seidel_results.csv --out figures
@@ -0,0 +1,61 @@
+"""
+Cython versions of the Julia set kernel
+"""
+
+import numpy as np
+cimport cython
+from cython.parallel cimport prange
+
+
+cdef inline int escape_time(double zr, double zi, double cr, double ci, int maxiter) nogil:
+    # the real/imaginary update is the same arithmetic as python's complex z * z + c.
+    # |z|^2 < 4 instead of abs(z) < 2 avoids a hypot() call per iteration (~3x faster),
+    # it can differ from the python kernel in the last bit for points right on the
+    # escape radius, the 1000^2 checksum is unchanged
+    cdef int n = 0
+    cdef double tmp
+    while zr * zr + zi * zi < 4.0 and n < maxiter:
+        tmp = zr * zr - zi * zi + cr
+        zi = zr * zi + zi * zr + ci
+        zr = tmp
+        n += 1
+    return n
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def calculate_z(int maxiter, double complex[:] zs, double complex c):
+    cdef Py_ssize_t i
+    cdef int[:] output = np.zeros(zs.shape[0], dtype=np.intc)
+    for i in range(zs.shape[0]):
+        output[i] = escape_time(zs[i].real, zs[i].imag, c.real, c.imag, maxiter)
+    return np.asarray(output)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def calculate_z_split(int maxiter, double[:] zr, double[:] zi, double cr, double ci):
+    cdef Py_ssize_t i
+    cdef int[:] output = np.zeros(zr.shape[0], dtype=np.intc)
+    for i in range(zr.shape[0]):
+        output[i] = escape_time(zr[i], zi[i], cr, ci, maxiter)
+    return np.asarray(output)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def calculate_z_prange(int maxiter, double[:] zr, double[:] zi, double cr, double ci, int num_threads=0):
+    """
+    OpenMP version of calculate_z_split, the GIL is released for the whole loop.
+    Dynamic scheduling since the work per point varies between 1 and maxiter iterations.
+    num_threads=0 uses the OpenMP default.
+    """
+    cdef Py_ssize_t i
+    cdef int[:] output = np.zeros(zr.shape[0], dtype=np.intc)
+    if num_threads <= 0:
+        for i in prange(zr.shape[0], nogil=True, schedule='dynamic', chunksize=1024):
+            output[i] = escape_time(zr[i], zi[i], cr, ci, maxiter)
+    else:
+        for i in prange(zr.shape[0], nogil=True, schedule='dynamic', chunksize=1024, num_threads=num_threads):
+            output[i] = escape_time(zr[i], zi[i], cr, ci, maxiter)
+    return np.asarray(output)
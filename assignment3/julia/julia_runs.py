@@ -0,0 +1,61 @@
+"""
+Julia set timings of the cython kernels against the pure python and numpy versions
+(compare assignment1/JuliaSetRuns.py). Build the extension first with
+python setup.py build_ext --inplace
+"""
+
+import os
+import sys
+from functools import wraps
+from timeit import default_timer as timer
+import numpy as np
+import cython_julia
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "assignment2"))
+from JuliaSet import iter_row_tiles, calculate_z_serial_purepython, calculate_z_numpy, c_real, c_imag
+
+
+def timefn(fn):
+    @wraps(fn)
+    def measure_time(*args, **kwargs):
+        t1 = timer()
+        result = fn(*args, **kwargs)
+        t2 = timer()
+        print(f"@timefn: {fn.__name__} took {t2 - t1} seconds")
+        return result, t2 - t1
+    return measure_time
+
+
+if __name__ == "__main__":
+    desired_width = 1000
+    max_iterations = 300
+    runs = 5
+    c = complex(c_real, c_imag)
+    # one tile holding the whole grid
+    _, zs = next(iter_row_tiles(desired_width, desired_width))
+    z = np.array(zs)
+    zr = np.ascontiguousarray(z.real)
+    zi = np.ascontiguousarray(z.imag)
+    print("Total elements:", len(zs))
+
+    kernels = {
+        "python": lambda: calculate_z_serial_purepython(max_iterations, zs, c),
+        "numpy": lambda: calculate_z_numpy(max_iterations, z, c),
+        "cython complex": lambda: cython_julia.calculate_z(max_iterations, z, c),
+        "cython real/imag": lambda: cython_julia.calculate_z_split(max_iterations, zr, zi, c.real, c.imag),
+        "cython prange": lambda: cython_julia.calculate_z_prange(max_iterations, zr, zi, c.real, c.imag),
+    }
+    means = {}
+    for name, kernel in kernels.items():
+        kernel.__name__ = name
+        times = []
+        for _ in range(runs):
+            output, t = timefn(kernel)()
+            # It ensures that our code evolves exactly as we'd intended
+            assert sum(output) == 33219980
+            times.append(t)
+        means[name] = np.mean(times)
+        print(f"{name}: mean {means[name]} seconds, standard deviation {np.std(times)} over {runs} runs")
+
+    for name, mean in means.items():
+        print(f"{name:>20}: {mean:.4f} s, speed-up over python {means['python'] / mean:.1f}")
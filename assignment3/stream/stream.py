@@ -3,16 +3,13 @@ Author: Johan Ericsson
 Date: 2022-02-14
 """
 
+import os
+import sys
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib
-from matplotlib import rcParams
-from cycler import cycler
-import seaborn as sns
 from array import array
-from time import perf_counter_ns as timer
 
-import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "benchmarks"))
+from harness import Registry, make_parser, main as run_benchmarks
 
 """
 We use arrays of doubles i.e. 8bytes = 64bit this is since python's builtin type float is a 64 bit float
@@ -41,117 +38,68 @@ def initialise_np_arrays(STREAM_ARRAY_SIZE):
     return a, b, c
 
 
-def benchmark(a, b, c, STREAM_ARRAY_SIZE, scalar_=2.0):
-    scalar = scalar_
-    times = [0] * 4
-
-    # copy
-    times[0] = timer()
+def copy(a, b, c, STREAM_ARRAY_SIZE, scalar=2.0):
     for j in range(STREAM_ARRAY_SIZE):
         c[j] = a[j]
-    times[0] = timer() - times[0]
 
-    # scale
-    times[1] = timer()
+
+def scale(a, b, c, STREAM_ARRAY_SIZE, scalar=2.0):
     for j in range(STREAM_ARRAY_SIZE):
         b[j] = scalar * c[j]
-    times[1] = timer() - times[1]
-    # sum
-    times[2] = timer()
+
+
+def add(a, b, c, STREAM_ARRAY_SIZE, scalar=2.0):
     for j in range(STREAM_ARRAY_SIZE):
         c[j] = a[j] + b[j]
-    times[2] = timer() - times[2]
 
-    # triad
-    times[3] = timer()
+
+def triad(a, b, c, STREAM_ARRAY_SIZE, scalar=2.0):
     for j in range(STREAM_ARRAY_SIZE):
         a[j] = b[j] + scalar * c[j]
-    times[3] = timer() - times[3]
-
-    return times
 
 
-def benchmark_numpy(a, b, c, STREAM_ARRAY_SIZE, scalar_=2.0):
-
-    scalar = scalar_
-    times = [0] * 4
-    # copy
-    times[0] = timer()
+def copy_numpy(a, b, c, STREAM_ARRAY_SIZE, scalar=2.0):
     np.multiply(scalar, a, out=c)
-    times[0] = timer() - times[0]
 
-    # scale
-    times[1] = timer()
+
+def scale_numpy(a, b, c, STREAM_ARRAY_SIZE, scalar=2.0):
     np.multiply(scalar, c, out=b)
-    times[1] = timer() - times[1]
 
-    # sum
-    times[2] = timer()
+
+def add_numpy(a, b, c, STREAM_ARRAY_SIZE, scalar=2.0):
     np.add(a, b, out=c)
-    times[2] = timer() - times[2]
 
-    # triad
-    times[3] = timer()
+
+def triad_numpy(a, b, c, STREAM_ARRAY_SIZE, scalar=2.0):
     np.add(b, np.multiply(scalar, c), out=a)
-    times[3] = timer() - times[3]
-    return times    # list of times [copy, scale, sum, triad]
 
 
-def compute_bandwidths(timings, type_size, array_length, dfs, container):
+# bytes moved per element: copy and scale read one array and write one, add and triad read two
+STREAM_BYTES = {'copy': 2, 'scale': 2, 'add': 3, 'triad': 3}
+
+
+def stream_registry(kernels, initialisers, vector_length, type_size=8):
     """
-    @parameter timing: measured time in list [copy_time, add_time, scale_time, triad_time]
+    STREAM cases, kernels maps a container name to its (copy, scale, add, triad)
+    functions and initialisers to its initialise function. The throughput is the
+    bandwidth in B/s.
     """
-    dfs['copy'][container][array_length] = 2 * type_size * array_length * 1e3 / timings[0]
-    dfs['scale'][container][array_length] = 2 * type_size * array_length * 1e3 / timings[1]
-    dfs['add'][container][array_length] = 3 * type_size * array_length * 1e3 / timings[2]
-    dfs['triad'][container][array_length] = 3 * type_size * array_length * 1e3 / timings[3]
+    registry = Registry()
+    for container, functions in kernels.items():
+        initialise = initialisers[container]
+        for stream_type, fn in zip(STREAM_BYTES, functions):
+            registry.register(stream_type, container, vector_length, lambda n, init=initialise: (*init(n), n), fn,
+                              lambda n, k=STREAM_BYTES[stream_type]: k * type_size * n, "B")
+    return registry
 
 
 if __name__ == '__main__':
-    STREAM_ARRAY_TYPE_SIZE = 8  # float64 = 8bytes
     vector_length = [2**i for i in range(4, 16)]  # we grow the size exponentially
-    stream_types = ('copy', 'scale', 'add', 'triad')
-    containers = ('list', 'array.array', 'np.ndarray')
-    data_frames = {}
-    for s in stream_types:
-        data_frames[s] = pd.DataFrame(index=vector_length, columns=containers)
-    for l in vector_length:
-        STREAM_ARRAY_SIZE = l
-
-        # List bandwidth computation
-        a, b, c = initialise_lists(STREAM_ARRAY_SIZE)
-        timings = benchmark(a, b, c, STREAM_ARRAY_SIZE)
-        compute_bandwidths(timings, STREAM_ARRAY_TYPE_SIZE, STREAM_ARRAY_SIZE, data_frames, container='list')
-        # array bandwidth computation
-        a, b, c = initialise_arrays(STREAM_ARRAY_SIZE)
-        timings = benchmark(a, b, c, STREAM_ARRAY_SIZE)
-        compute_bandwidths(timings, STREAM_ARRAY_TYPE_SIZE, STREAM_ARRAY_SIZE, data_frames, container='array.array')
-
-        # numpy bandwidth computation
-        a, b, c = initialise_np_arrays(STREAM_ARRAY_SIZE)
-        timings = benchmark_numpy(a, b, c, STREAM_ARRAY_SIZE)
-        compute_bandwidths(timings, STREAM_ARRAY_TYPE_SIZE, STREAM_ARRAY_SIZE, data_frames, container='np.ndarray')
-
-    # Bandwidth bytes/s = 10^9 * data_size / time_ns => Mbytes/s = 10^3 * data_size / time_ns
-
-    rcParams.update({'font.size': 20})
-    colors = ['r', 'g', 'b']
-    sns.color_palette("Set2", 3)
-    x = 'Container size (number of objects)'
-    y = 'Bandwidth (Mbytes/s)'
-    for stream_type, df in data_frames.items():
-        fig, ax = plt.subplots(figsize=(16, 10))
-        title = 'STREAM BENCHMARK: ' + stream_type
-        ax.set_xlabel("Container size")
-        ax.set_ylabel("Bandwidth (Mbyte/s)")
-        ax.set(yscale="log")
-        plt.grid(True, which="both")
-        lines = ax.plot(df.index, df.values, "o:", linewidth=2.0, label=df.columns)
-        for col, line in zip(colors, lines):
-            line.set_color(col)
-        ax.legend()
-        ax.set_xticks(df.index, minor=True)
-        fig.suptitle(title)
-        fig.tight_layout()
-        fig.savefig("figures/stream_"+stream_type+".pdf", format="pdf")
-    plt.show()
\ No newline at end of file
+    initialisers = {'list': initialise_lists, 'array.array': initialise_arrays, 'np.ndarray': initialise_np_arrays}
+    kernels = {'list': (copy, scale, add, triad),
+               'array.array': (copy, scale, add, triad),
+               'np.ndarray': (copy_numpy, scale_numpy, add_numpy, triad_numpy)}
+    args = make_parser("STREAM benchmark", "stream_results.csv").parse_args()
+    run_benchmarks(stream_registry(kernels, initialisers, vector_length), args)
+    # bandwidth figures: python ../../benchmarks/harness.py plot stream_results.csv --metric throughput --out figures \
+    #     --name stream_{kernel}
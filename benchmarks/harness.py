@@ -0,0 +1,368 @@
+"""
+Shared benchmark runner for the timing scripts of the assignments.
+A script fills a Registry with (kernel, backend, size) cases and hands it to
+main(), which runs the cases with warm-up runs and repeats, rejects outliers,
+computes a confidence interval of the mean and writes the results to a CSV or
+JSON file. The timer granularity is measured once with
+clock_granularity.checktick and a function that runs faster than
+min_multiple times the granularity is called several times per sample
+(inner calls), results that are still too close to the clock resolution are
+flagged as noisy. Plotting is a separate step that only reads that file:
+
+    python harness.py plot dgemm_results.csv --metric throughput --peak 5e9 --out figures
+
+so sweeps can run headless, matplotlib is only imported for plotting. With
+--db the results are also kept in the regression store, see results_db.py, with
+--counters cycles, instructions, cache and branch misses are read as well, see
+perf_counters.py.
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+from contextlib import nullcontext
+from time import perf_counter_ns as timer
+import numpy as np
+
+# appended after the directories of the scripts, which are inserted in front, so that assignment1's JuliaSet.py
+# does not shadow the one of assignment2
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "assignment1"))
+from clock_granularity import checktick
+
+FIELDS = ("kernel", "backend", "size", "repeats", "inner", "outliers", "mean", "std", "median", "min", "max",
+          "ci_low", "ci_high", "noisy", "work", "unit", "throughput",
+          "cycles", "instructions", "llc_misses", "branch_misses", "ipc", "bytes_per_flop")
+COUNTER_FIELDS = FIELDS[-6:]
+
+# counts of a case that spent more than this share of its CPU time outside the calling thread are dropped,
+# the counters only see the calling thread
+MAX_OTHER_THREADS = 0.1
+
+# a sample must last at least this many clock ticks
+MIN_MULTIPLE = 1000
+MAX_INNER = 1 << 20
+
+
+class Case:
+    """
+    One benchmark case. setup(size) returns the arguments of fn, it is called
+    before every sample and is not timed, so fn may modify its arguments (when
+    fn is called several times per sample the later calls get the modified ones).
+    work(size) is the amount of work of one call in unit (e.g. FLOP or B), the
+    throughput is reported in unit/s.
+    """
+    def __init__(self, kernel, backend, size, setup, fn, work=None, unit=None):
+        self.kernel = kernel
+        self.backend = backend
+        self.size = size
+        self.setup = setup
+        self.fn = fn
+        self.work = work
+        self.unit = unit
+
+    def __repr__(self):
+        return f"Case({self.kernel}, {self.backend}, {self.size})"
+
+
+class Registry:
+    def __init__(self):
+        self.cases = []
+
+    def register(self, kernel, backend, sizes, setup, fn, work=None, unit=None):
+        """Add one case per size"""
+        for size in sizes:
+            self.cases.append(Case(kernel, backend, size, setup, fn, work, unit))
+
+    def select(self, kernels=None, backends=None, sizes=None):
+        """The cases of the given kernels, backends and sizes (None selects all)"""
+        return [case for case in self.cases
+                if (kernels is None or case.kernel in kernels)
+                and (backends is None or case.backend in backends)
+                and (sizes is None or case.size in sizes)]
+
+
+def reject_outliers(samples, k=1.5):
+    """Samples inside Tukey's fences [q1 - k iqr, q3 + k iqr]"""
+    samples = np.asarray(samples, dtype=np.float64)
+    if len(samples) < 4:
+        return samples
+    q1, q3 = np.percentile(samples, [25, 75])
+    iqr = q3 - q1
+    return samples[(samples >= q1 - k * iqr) & (samples <= q3 + k * iqr)]
+
+
+def confidence_interval(samples, level=0.95, n_resamples=1000, seed=0):
+    """Bootstrap confidence interval of the mean, no assumption on the distribution
+    of the timings (they are usually skewed towards long times)"""
+    samples = np.asarray(samples, dtype=np.float64)
+    if len(samples) < 2:
+        return samples[0], samples[0]
+    rng = np.random.default_rng(seed)
+    means = rng.choice(samples, (n_resamples, len(samples))).mean(axis=1)
+    alpha = (1 - level) / 2
+    low, high = np.percentile(means, [100 * alpha, 100 * (1 - alpha)])
+    return low, high
+
+
+def calibrate(timer_function=timer):
+    """Granularity of timer_function in ns"""
+    return int(checktick(timer_function))
+
+
+def summarize(case, samples, inner=1, noisy=False, counts=None):
+    """Statistics of the timings (seconds per call) of a case, outliers are left out,
+    counts are the hardware counter fields per call (None without counters)"""
+    kept = reject_outliers(samples)
+    ci_low, ci_high = confidence_interval(kept)
+    mean = kept.mean()
+    work = case.work(case.size) if case.work is not None else None
+    return {"kernel": case.kernel, "backend": case.backend, "size": case.size,
+            "repeats": len(samples), "inner": inner, "outliers": len(samples) - len(kept),
+            "mean": mean, "std": kept.std(), "median": np.median(kept), "min": kept.min(), "max": kept.max(),
+            "ci_low": ci_low, "ci_high": ci_high, "noisy": noisy, "work": work, "unit": case.unit,
+            "throughput": work / mean if work is not None else None, "samples": list(samples),
+            **(counts or dict.fromkeys(COUNTER_FIELDS))}
+
+
+def _time_calls(case, inner, counters=None):
+    """ns of inner calls of the case on one setup, counted by counters if given"""
+    args = case.setup(case.size)
+    with counters if counters is not None else nullcontext():
+        t0 = timer()
+        for _ in range(inner):
+            case.fn(*args)
+        t1 = timer()
+    return t1 - t0
+
+
+def time_case(case, warmup=1, repeats=10, min_time=0, max_inner=MAX_INNER, counters=None):
+    """
+    Timings in seconds per call of repeats samples of the case after warmup
+    untimed samples. The number of calls per sample (inner) is raised, starting
+    from the time of the last warm-up sample, until a sample takes 1.5 min_time
+    ns, the margin keeps the timed samples above min_time. Returns the timings, inner and whether a timed sample was shorter
+    than min_time all the same (noisy). Only the timed samples are added to the
+    perf_counters.PerfCounters counters if given.
+    """
+    inner = 1
+    elapsed = None
+    for _ in range(warmup):
+        elapsed = _time_calls(case, inner)
+    target = 1.5 * min_time
+    if elapsed is None:
+        # without a warm-up sample the first calibration sample is timed on its own
+        elapsed = _time_calls(case, inner) if min_time > 0 else 0
+    while elapsed < target and inner < max_inner:
+        # a sample below the clock resolution measures as 0, the growth is limited to 10x per step
+        inner = min(max_inner, inner * min(10, max(2, math.ceil(target / max(elapsed, 1)))))
+        elapsed = _time_calls(case, inner)
+    totals = [_time_calls(case, inner, counters) for _ in range(repeats)]
+    samples = [t * 1e-9 / inner for t in totals]
+    return samples, inner, min(totals) < min_time
+
+
+def _counts_per_call(counters, case, calls):
+    from perf_counters import derived_metrics
+    if counters.other_threads > MAX_OTHER_THREADS:
+        return None
+    counts = {name: value / calls if value is not None else None for name, value in counters.read().items()}
+    flops = case.work(case.size) if case.work is not None and case.unit == "FLOP" else None
+    return {**counts, **derived_metrics(counts, flops)}
+
+
+def run(cases, warmup=1, repeats=10, verbose=True, granularity=None, min_multiple=MIN_MULTIPLE, counters=False):
+    """
+    Run the cases, every timed sample lasts at least min_multiple times the timer
+    granularity (ns), which is measured if not given. With counters the hardware
+    counters (perf_counters.py) are read around the timed samples and reported
+    per call with IPC and the bytes moved per FLOP. They count the calling thread
+    only, a case that runs partly on other threads (BLAS, numexpr, OpenMP, thread
+    pools) gets no counts.
+    """
+    if granularity is None:
+        granularity = calibrate()
+    if verbose:
+        print(f"timer granularity {granularity} ns, samples of at least {granularity * min_multiple} ns")
+    perf = None
+    if counters:
+        from perf_counters import PerfCounters
+        perf = PerfCounters()
+        if not perf.available:
+            print(f"hardware counters not available ({perf.reason}), timings only")
+            perf = None
+    results = []
+    for case in cases:
+        if perf is not None:
+            perf.reset()
+        samples, inner, noisy = time_case(case, warmup, repeats, granularity * min_multiple, counters=perf)
+        counts = _counts_per_call(perf, case, inner * repeats) if perf is not None else None
+        result = summarize(case, samples, inner, noisy, counts)
+        if verbose:
+            print(format_result(result))
+            if perf is not None and counts is None:
+                print(f"{'':>14} {100 * perf.other_threads:.0f}% of the CPU time on other threads, the counters "
+                      f"cover the calling thread only, no counts reported")
+        results.append(result)
+    return results
+
+
+def format_result(result):
+    line = (f"{result['kernel']:>14} {result['backend']:>20} {result['size']:>8}: "
+            f"{result['mean']:.3e} s [{result['ci_low']:.3e}, {result['ci_high']:.3e}]")
+    if result["inner"] > 1:
+        line += f", {result['inner']} calls per sample"
+    if result["outliers"]:
+        line += f", {result['outliers']} outliers"
+    if result["noisy"]:
+        line += ", NOISY: samples close to the timer granularity"
+    if result["throughput"] is not None:
+        line += f", {result['throughput']:.3e} {result['unit']}/s"
+    if result.get("ipc") is not None:
+        line += f", IPC {result['ipc']:.2f}, {result['llc_misses']:.3g} LLC misses"
+    if result.get("bytes_per_flop") is not None:
+        line += f", {result['bytes_per_flop']:.3g} B/FLOP"
+    return line
+
+
+def write_results(results, path):
+    """Results as CSV or JSON, by the extension of path"""
+    rows = [{field: _plain(result[field]) for field in FIELDS} for result in results]
+    if path.endswith(".json"):
+        with open(path, "w") as f:
+            json.dump(rows, f, indent=1)
+    else:
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def read_results(path):
+    if path.endswith(".json"):
+        with open(path) as f:
+            return json.load(f)
+    results = []
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            for field in FIELDS:
+                row[field] = _parse(row[field])
+            results.append(row)
+    return results
+
+
+def _plain(value):
+    # numpy scalars are not JSON serializable
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _parse(value):
+    if value == "":
+        return None
+    if value in ("True", "False"):
+        return value == "True"
+    for conversion in (int, float):
+        try:
+            return conversion(value)
+        except ValueError:
+            pass
+    return value
+
+
+def plot_results(results, metric="mean", out=None, log=True, name="{kernel}", peak=None,
+                 peak_label="theoretical peak"):
+    """
+    One figure per kernel with a line per backend against size, metric is a field
+    of the results ("mean", "median", "throughput", ...), the mean has its
+    confidence interval as error bars. peak draws a dotted reference line at that
+    value (e.g. the peak FLOP/s for the throughput). The figures are saved as
+    out/<name>.pdf, name is formatted with the kernel, if out is given and shown
+    otherwise.
+    """
+    import matplotlib.pyplot as plt
+    kernels = {}
+    for result in results:
+        kernels.setdefault(result["kernel"], {}).setdefault(result["backend"], []).append(result)
+    for kernel, backends in kernels.items():
+        fig, ax = plt.subplots()
+        for backend, rows in backends.items():
+            rows = sorted(rows, key=lambda r: r["size"])
+            sizes = [r["size"] for r in rows]
+            values = [r[metric] for r in rows]
+            if metric == "mean":
+                yerr = [[r["mean"] - r["ci_low"] for r in rows], [r["ci_high"] - r["mean"] for r in rows]]
+                ax.errorbar(sizes, values, yerr=yerr, label=backend, capsize=3)
+            else:
+                ax.plot(sizes, values, "o:", label=backend)
+        if peak is not None:
+            ax.axhline(peak, color="k", linestyle="dotted", label=peak_label)
+        unit = next(iter(backends.values()))[0]["unit"]
+        ax.set_xlabel("size")
+        ax.set_ylabel(f"{unit}/s" if metric == "throughput" else f"{metric} (s)")
+        if log:
+            ax.set_yscale("log")
+        ax.grid(which="both")
+        ax.legend()
+        ax.set_title(kernel)
+        fig.tight_layout()
+        if out is not None:
+            os.makedirs(out, exist_ok=True)
+            fig.savefig(os.path.join(out, name.format(kernel=kernel) + ".pdf"), format="pdf")
+    if out is None:
+        plt.show()
+
+
+def make_parser(description, default_output):
+    """Command line of a benchmark script, scripts can add their own arguments"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--kernels", nargs="+", help="kernels to run (default all)")
+    parser.add_argument("--backends", nargs="+", help="backends to run (default all)")
+    parser.add_argument("--sizes", nargs="+", type=int, help="sizes to run (default all)")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed samples before the timed ones")
+    parser.add_argument("--repeats", type=int, default=10, help="timed samples per case")
+    parser.add_argument("--min-multiple", type=int, default=MIN_MULTIPLE,
+                        help="shortest sample in multiples of the timer granularity")
+    parser.add_argument("--output", default=default_output, help="results file, .csv or .json")
+    parser.add_argument("--counters", action="store_true",
+                        help="read the hardware counters (Linux perf_event_open) around the timed samples, "
+                             "calling thread only, multithreaded cases get no counts")
+    parser.add_argument("--db", nargs="?", const="", help="also store the results in this SQLite results store "
+                                                          "(benchmarks/results.sqlite if no file is given)")
+    parser.add_argument("--list", action="store_true", help="list the cases and exit")
+    return parser
+
+
+def main(registry, args):
+    """Run the cases selected by the parsed arguments args of make_parser and write the results"""
+    cases = registry.select(args.kernels, args.backends, args.sizes)
+    if args.list:
+        for case in cases:
+            print(case)
+        return []
+    results = run(cases, args.warmup, args.repeats, min_multiple=args.min_multiple, counters=args.counters)
+    write_results(results, args.output)
+    print(f"results written to {args.output}")
+    if args.db is not None:
+        from results_db import DEFAULT_DB, connect, store_run
+        path = args.db or DEFAULT_DB
+        run_id = store_run(connect(path), results, label=os.path.basename(sys.argv[0]))
+        print(f"stored as run {run_id} in {path}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Plot benchmark results")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    plot_parser = subparsers.add_parser("plot", help="plot a results file")
+    plot_parser.add_argument("results", help="results file, .csv or .json")
+    plot_parser.add_argument("--metric", default="mean", help="mean, median, min or throughput")
+    plot_parser.add_argument("--out", help="directory for the figures, they are shown if not given")
+    plot_parser.add_argument("--linear", action="store_true", help="linear instead of log scale")
+    plot_parser.add_argument("--name", default="{kernel}", help="file name of the figures, e.g. stream_{kernel}")
+    plot_parser.add_argument("--peak", type=float, help="dotted reference line at this value")
+    plot_parser.add_argument("--peak-label", default="theoretical peak", help="legend entry of the reference line")
+    args = parser.parse_args()
+    plot_results(read_results(args.results), args.metric, args.out, not args.linear, args.name, args.peak,
+                 args.peak_label)
@@ -0,0 +1,170 @@
+"""
+Hardware performance counters of the calling process through the Linux
+perf_event_open system call (with ctypes, no perf tool needed): cycles,
+instructions, last level cache misses and branch misses. Where the counters
+cannot be opened (not Linux, no PMU in a VM or container, perf_event_paranoid
+too high) PerfCounters.available is False, reason says why and the counts are
+None, so a caller can always use it and just gets timings only.
+The counters cover the calling thread only. Work that numpy's BLAS, numexpr,
+OpenMP or a thread pool does on other threads is not counted, other_threads
+tells the share of the CPU time that was spent outside the calling thread.
+
+    counters = PerfCounters()
+    with counters:
+        kernel()
+    print(counters.read())
+"""
+
+import ctypes
+import os
+import platform
+import struct
+import sys
+import time
+
+CACHE_LINE = 64
+
+# perf_event_attr.type and config of the counted events, see linux/perf_event.h
+PERF_TYPE_HARDWARE = 0
+EVENTS = {
+    "cycles": (PERF_TYPE_HARDWARE, 0),          # PERF_COUNT_HW_CPU_CYCLES
+    "instructions": (PERF_TYPE_HARDWARE, 1),    # PERF_COUNT_HW_INSTRUCTIONS
+    "llc_misses": (PERF_TYPE_HARDWARE, 3),      # PERF_COUNT_HW_CACHE_MISSES, usually the last level cache
+    "branch_misses": (PERF_TYPE_HARDWARE, 5),   # PERF_COUNT_HW_BRANCH_MISSES
+}
+
+SYSCALL_NUMBERS = {"x86_64": 298, "aarch64": 241, "ppc64le": 319}
+PERF_EVENT_IOC_ENABLE = 0x2400
+PERF_EVENT_IOC_DISABLE = 0x2401
+PERF_EVENT_IOC_RESET = 0x2403
+# value, time enabled and time running, the counts are scaled when the kernel multiplexes the counters
+PERF_FORMAT_TOTAL_TIME_ENABLED = 1
+PERF_FORMAT_TOTAL_TIME_RUNNING = 2
+# bits of the flags field
+DISABLED = 1 << 0
+EXCLUDE_KERNEL = 1 << 5
+EXCLUDE_HV = 1 << 6
+
+
+class PerfEventAttr(ctypes.Structure):
+    # PERF_ATTR_SIZE_VER1 (72 bytes), the kernel zero extends the rest
+    _fields_ = [("type", ctypes.c_uint32), ("size", ctypes.c_uint32), ("config", ctypes.c_uint64),
+                ("sample_period", ctypes.c_uint64), ("sample_type", ctypes.c_uint64),
+                ("read_format", ctypes.c_uint64), ("flags", ctypes.c_uint64),
+                ("wakeup_events", ctypes.c_uint32), ("bp_type", ctypes.c_uint32), ("config1", ctypes.c_uint64),
+                ("config2", ctypes.c_uint64)]
+
+
+def _perf_event_open(event_type, config):
+    """File descriptor of a counter of this process on any cpu, user space only"""
+    if sys.platform != "linux" or platform.machine() not in SYSCALL_NUMBERS:
+        raise OSError(f"perf_event_open is not supported on {sys.platform}/{platform.machine()}")
+    libc = ctypes.CDLL(None, use_errno=True)
+    attr = PerfEventAttr(type=event_type, size=ctypes.sizeof(PerfEventAttr), config=config,
+                         read_format=PERF_FORMAT_TOTAL_TIME_ENABLED | PERF_FORMAT_TOTAL_TIME_RUNNING,
+                         flags=DISABLED | EXCLUDE_KERNEL | EXCLUDE_HV)
+    fd = libc.syscall(ctypes.c_long(SYSCALL_NUMBERS[platform.machine()]), ctypes.byref(attr),
+                      ctypes.c_int(0), ctypes.c_int(-1), ctypes.c_int(-1), ctypes.c_ulong(0))
+    if fd < 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, f"perf_event_open: {os.strerror(errno)}")
+    return fd
+
+
+class PerfCounters:
+    """
+    The events of EVENTS for the calling thread. Counts accumulate over all
+    with blocks (or start/stop pairs) until reset, so do the CPU time of the
+    calling thread and of the whole process for other_threads.
+    """
+    def __init__(self, events=EVENTS):
+        self.fds = {}
+        self.reason = None
+        try:
+            for name, (event_type, config) in events.items():
+                self.fds[name] = _perf_event_open(event_type, config)
+        except OSError as e:
+            self.close()
+            self.reason = str(e)
+        self.totals = dict.fromkeys(events, 0.0)
+        self.thread_time = 0.0
+        self.process_time = 0.0
+
+    @property
+    def available(self):
+        return bool(self.fds)
+
+    def _ioctl(self, request):
+        import fcntl
+        for fd in self.fds.values():
+            fcntl.ioctl(fd, request, 0)
+
+    @property
+    def other_threads(self):
+        """Share of the process CPU time spent outside the calling thread while counting"""
+        if self.process_time <= 0:
+            return 0.0
+        return max(0.0, 1 - self.thread_time / self.process_time)
+
+    def start(self):
+        self._cpu_start = (time.thread_time(), time.process_time())
+        self._ioctl(PERF_EVENT_IOC_RESET)
+        self._ioctl(PERF_EVENT_IOC_ENABLE)
+
+    def stop(self):
+        self._ioctl(PERF_EVENT_IOC_DISABLE)
+        self.thread_time += time.thread_time() - self._cpu_start[0]
+        self.process_time += time.process_time() - self._cpu_start[1]
+        for name, fd in self.fds.items():
+            value, enabled, running = struct.unpack("QQQ", os.read(fd, 24))
+            self.totals[name] += value * enabled / running if running else 0.0
+
+    def __enter__(self):
+        if self.available:
+            self.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.available:
+            self.stop()
+
+    def reset(self):
+        self.totals = dict.fromkeys(self.totals, 0.0)
+        self.thread_time = 0.0
+        self.process_time = 0.0
+
+    def read(self):
+        """Accumulated counts, None for every event if the counters are not available"""
+        if not self.available:
+            return dict.fromkeys(self.totals)
+        return dict(self.totals)
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds = {}
+
+
+def derived_metrics(counts, flops=None):
+    """
+    IPC and, with the FLOP count of the measured code, the bytes moved from memory
+    per FLOP estimated as one cache line per last level cache miss
+    """
+    cycles, instructions, llc_misses = counts.get("cycles"), counts.get("instructions"), counts.get("llc_misses")
+    ipc = instructions / cycles if cycles else None
+    bytes_per_flop = llc_misses * CACHE_LINE / flops if llc_misses is not None and flops else None
+    return {"ipc": ipc, "bytes_per_flop": bytes_per_flop}
+
+
+if __name__ == '__main__':
+    import numpy as np
+    counters = PerfCounters()
+    if not counters.available:
+        print(f"hardware counters not available: {counters.reason}")
+    N = 512
+    A, B = np.ones((N, N)), np.ones((N, N))
+    with counters:
+        A.dot(B)
+    counts = counters.read()
+    print(counts, derived_metrics(counts, 2 * N**3))
+    print(f"{100 * counters.other_threads:.0f}% of the CPU time on other threads (not counted)")
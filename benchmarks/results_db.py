@@ -0,0 +1,227 @@
+"""
+Local SQLite store of benchmark results for regression tracking.
+Every run of the harness with --db is stored with the git commit it ran on and
+a fingerprint of the host (CPU model and core counts from psutil), every result
+row with its kernel, backend, size, statistics and the raw samples. compare
+checks two runs case by case and flags slowdowns that are both larger than a
+threshold and statistically significant (permutation test on the samples):
+
+    python results_db.py runs
+    python results_db.py compare <old run or commit> <new run or commit>
+
+compare exits with status 1 if there is a regression so it can gate a build.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+from datetime import datetime
+import numpy as np
+import psutil
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    created TEXT,
+    git_commit TEXT,
+    dirty INTEGER,
+    host TEXT,
+    cpu TEXT,
+    cores INTEGER,
+    threads INTEGER,
+    label TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER REFERENCES runs(id),
+    kernel TEXT,
+    backend TEXT,
+    size INTEGER,
+    repeats INTEGER,
+    inner INTEGER,
+    mean REAL,
+    std REAL,
+    median REAL,
+    ci_low REAL,
+    ci_high REAL,
+    noisy INTEGER,
+    work REAL,
+    unit TEXT,
+    throughput REAL,
+    samples TEXT
+);
+CREATE INDEX IF NOT EXISTS results_case ON results (kernel, backend, size);
+"""
+
+
+def cpu_model():
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def host_fingerprint():
+    """CPU model, physical cores and hardware threads of the host and a short hash of them"""
+    host = {"cpu": cpu_model(), "cores": psutil.cpu_count(logical=False) or 0,
+            "threads": psutil.cpu_count(logical=True) or 0}
+    key = f"{host['cpu']}|{host['cores']}|{host['threads']}|{platform.system()}|{platform.machine()}"
+    host["host"] = hashlib.sha1(key.encode()).hexdigest()[:12]
+    return host
+
+
+def git_commit(path=None):
+    """(commit, dirty) of the repository at path, (None, False) outside of git"""
+    path = path or os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=path, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=path,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+    return commit, bool(status.strip())
+
+
+def connect(path=DEFAULT_DB):
+    db = sqlite3.connect(path)
+    db.row_factory = sqlite3.Row
+    db.executescript(SCHEMA)
+    return db
+
+
+def store_run(db, results, label=None):
+    """Store the results of the harness as a new run, returns its id"""
+    commit, dirty = git_commit()
+    host = host_fingerprint()
+    cursor = db.execute(
+        "INSERT INTO runs (created, git_commit, dirty, host, cpu, cores, threads, label) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (datetime.now().isoformat(timespec="seconds"), commit, dirty, host["host"], host["cpu"], host["cores"],
+         host["threads"], label))
+    run_id = cursor.lastrowid
+    db.executemany(
+        "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [(run_id, r["kernel"], r["backend"], r["size"], r["repeats"], r.get("inner", 1), r["mean"], r["std"],
+          r["median"], r["ci_low"], r["ci_high"], bool(r.get("noisy")), r["work"], r["unit"], r["throughput"],
+          json.dumps(list(map(float, r["samples"]))) if r.get("samples") is not None else None)
+         for r in results])
+    db.commit()
+    return run_id
+
+
+def find_run(db, ref):
+    """Run id of ref, a run id or a (prefix of a) git commit, the latest run of that commit"""
+    if str(ref).isdigit():
+        row = db.execute("SELECT id FROM runs WHERE id = ?", (int(ref),)).fetchone()
+    else:
+        row = db.execute("SELECT id FROM runs WHERE git_commit LIKE ? ORDER BY id DESC LIMIT 1",
+                         (f"{ref}%",)).fetchone()
+    if row is None:
+        raise ValueError(f"no run {ref}")
+    return row["id"]
+
+
+def permutation_test(old, new, n_permutations=10000, seed=0):
+    """One-sided p-value of mean(new) > mean(old) under random relabelling of the samples"""
+    old = np.asarray(old)
+    new = np.asarray(new)
+    observed = new.mean() - old.mean()
+    pooled = np.concatenate([old, new])
+    rng = np.random.default_rng(seed)
+    # every row is a random permutation of the pooled samples
+    permuted = rng.permuted(np.tile(pooled, (n_permutations, 1)), axis=1)
+    differences = permuted[:, len(old):].mean(axis=1) - permuted[:, :len(old)].mean(axis=1)
+    return (np.count_nonzero(differences >= observed) + 1) / (n_permutations + 1)
+
+
+def compare_runs(db, old_id, new_id, threshold=0.05, alpha=0.01):
+    """
+    The cases of both runs with the relative change of the mean time and the
+    p-value of a slowdown. A case is a regression if it is more than threshold
+    slower with p < alpha. Without samples (imported results) the confidence
+    intervals of the means must not overlap instead.
+    """
+    query = "SELECT * FROM results WHERE run_id = ?"
+    old = {(r["kernel"], r["backend"], r["size"]): r for r in db.execute(query, (old_id,))}
+    comparisons = []
+    for r in db.execute(query + " ORDER BY rowid", (new_id,)):
+        key = (r["kernel"], r["backend"], r["size"])
+        if key not in old:
+            continue
+        o = old[key]
+        change = r["mean"] / o["mean"] - 1
+        if o["samples"] is not None and r["samples"] is not None:
+            p = permutation_test(json.loads(o["samples"]), json.loads(r["samples"]))
+            significant = p < alpha
+        else:
+            p = None
+            significant = r["ci_low"] > o["ci_high"]
+        if change > threshold and significant:
+            status = "REGRESSION"
+        elif change < -threshold and (r["ci_high"] < o["ci_low"] if p is None else p > 1 - alpha):
+            status = "improvement"
+        else:
+            status = "ok"
+        comparisons.append({"kernel": key[0], "backend": key[1], "size": key[2], "old": o["mean"],
+                            "new": r["mean"], "change": change, "p": p, "status": status,
+                            "noisy": bool(o["noisy"] or r["noisy"])})
+    return comparisons
+
+
+def print_comparison(db, old_id, new_id, comparisons):
+    runs = {r["id"]: r for r in db.execute("SELECT * FROM runs WHERE id IN (?, ?)", (old_id, new_id))}
+    for run_id in (old_id, new_id):
+        run = runs[run_id]
+        print(f"run {run_id}: {run['git_commit'] or '?'}{' (dirty)' if run['dirty'] else ''} on {run['cpu']} "
+              f"[{run['host']}], {run['created']}")
+    if runs[old_id]["host"] != runs[new_id]["host"]:
+        print("warning: the runs are from different hosts")
+    for c in comparisons:
+        p = f"{c['p']:.4f}" if c["p"] is not None else "   -  "
+        print(f"{c['kernel']:>14} {c['backend']:>20} {c['size']:>8}: {c['old']:.3e} s -> {c['new']:.3e} s "
+              f"{100 * c['change']:+7.1f}%  p={p}  {c['status']}{' (noisy)' if c['noisy'] else ''}")
+
+
+def list_runs(db):
+    for run in db.execute("SELECT runs.*, COUNT(results.run_id) AS n FROM runs LEFT JOIN results "
+                          "ON results.run_id = runs.id GROUP BY runs.id ORDER BY runs.id"):
+        commit = (run["git_commit"] or "?")[:10] + ("+" if run["dirty"] else "")
+        print(f"{run['id']:>5} {run['created']} {commit:<11} {run['host']} {run['label'] or '':<24} {run['n']} results")
+
+
+if __name__ == '__main__':
+    from harness import read_results
+    parser = argparse.ArgumentParser(description="Benchmark results store")
+    parser.add_argument("--db", default=DEFAULT_DB, help="SQLite file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("runs", help="list the stored runs")
+    import_parser = subparsers.add_parser("import", help="store a CSV/JSON results file of the harness")
+    import_parser.add_argument("results")
+    import_parser.add_argument("--label")
+    compare_parser = subparsers.add_parser("compare", help="flag regressions of a run against another")
+    compare_parser.add_argument("old", help="run id or git commit")
+    compare_parser.add_argument("new", help="run id or git commit")
+    compare_parser.add_argument("--threshold", type=float, default=0.05, help="smallest relative slowdown")
+    compare_parser.add_argument("--alpha", type=float, default=0.01, help="significance level")
+    args = parser.parse_args()
+
+    db = connect(args.db)
+    if args.command == "runs":
+        list_runs(db)
+    elif args.command == "import":
+        print(f"stored as run {store_run(db, read_results(args.results), args.label or args.results)}")
+    else:
+        old_id, new_id = find_run(db, args.old), find_run(db, args.new)
+        comparisons = compare_runs(db, old_id, new_id, args.threshold, args.alpha)
+        print_comparison(db, old_id, new_id, comparisons)
+        sys.exit(1 if any(c["status"] == "REGRESSION" for c in comparisons) else 0)
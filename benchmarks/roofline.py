@@ -0,0 +1,324 @@
+"""
+Roofline model of this host and the kernels of the assignments.
+The roofs are measured: the memory bandwidth with the STREAM triad as two
+numpy passes and the peak FLOP/s with the BLAS dgemm (dgemm_numpy). Every
+kernel/backend is timed with the harness and placed at its arithmetic
+intensity (FLOP per byte of memory traffic). Its memory roof is the triad
+bandwidth on a working set of the kernel's size, so a kernel that runs from
+the caches is held against the caches and not the main memory, and a last
+level cache shared with other cores counts with the share that is really
+available. The intensity comes from a model of the traffic of the
+implementation as written: every numpy pass reads and writes whole arrays and
+a python float in a list is an 8 byte pointer to a 24 byte object. With
+--counters and working hardware counters the measured intensity (LLC misses
+times the cache line) is shown as well. A kernel left of the ridge point of
+its roof is memory bound, one right of it compute bound, unless it reaches
+less than 10% of its roof: then it is bound by overheads (interpreter, calls,
+latencies) and neither roof matters yet. A kernel above its roof moves less
+data than modelled and is not classified.
+
+    python roofline.py --plot roofline.pdf
+"""
+
+import argparse
+import csv
+import glob
+import math
+import os
+import sys
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# at the front and in this order, assignment1 and assignment2 both have a JuliaSet.py and the one of assignment2
+# has iter_row_tiles
+for directory in reversed(("assignment2", "assignment1", os.path.join("assignment3", "stream"),
+                           os.path.join("assignment3", "gauss_seidel"), os.path.join("assignment3", "julia"),
+                           "game_of_life")):
+    sys.path.insert(0, os.path.join(HERE, "..", directory))
+
+from harness import Registry, run
+from dgemm import dgemm_numpy
+from JuliaSet import calculate_z_numpy, calculate_z_serial_purepython, iter_row_tiles, c_real, c_imag
+from diffusion import evolve, evolve_blocked, evolve_numpy, grid_shape, set_initial_conditions
+from gauss_seidel import cython_gs, gauss_seidel, gauss_seidel_pycollection, grid_list, grid_numpy, run_sweeps
+from game_of_life import gosper_grid, run_updates
+from dft import DFT, DFT3, fft
+try:
+    # the cython kernels are placed on the roofline when they have been built
+    import cython_julia
+except ImportError:
+    cython_julia = None
+
+# bytes of a float in a python list, the pointer and the float object
+PY_FLOAT = 32
+FIELDS = ("kernel", "backend", "size", "flops", "bytes", "footprint", "level", "intensity", "measured_intensity",
+          "gflops", "roof", "fraction", "bound")
+SIZE_SUFFIXES = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+def triad_passes(a, b, c, scalar=2.0):
+    """The STREAM triad a = b + scalar*c as two numpy passes without a temporary"""
+    np.multiply(c, scalar, out=a)
+    np.add(a, b, out=a)
+
+
+def measure_bandwidth(n=1 << 24, repeats=5):
+    """
+    Best numpy triad bandwidth in B/s. The bytes of both passes are counted (5
+    arrays, not the 3 of STREAM) like the traffic of the kernels is modelled,
+    every numpy pass reading and writing whole arrays.
+    """
+    # allocated and touched once, a fresh array (or the temporary of triad_numpy) would time the page faults of
+    # its first use
+    arrays = (np.ones(n), 2.0 * np.ones(n), np.ones(n))
+    registry = Registry()
+    registry.register("triad", "np.ndarray", [n], lambda n: arrays, triad_passes, lambda n: 5 * 8 * n, "B")
+    result = run(registry.cases, repeats=repeats, verbose=False)[0]
+    return result["work"] / result["min"]
+
+
+def cache_sizes():
+    """Sizes in bytes of the data and unified caches of cpu 0 by level, from sysfs (Linux), empty if not known"""
+    sizes = {}
+    for index in glob.glob("/sys/devices/system/cpu/cpu0/cache/index*"):
+        try:
+            with open(os.path.join(index, "type")) as f:
+                kind = f.read().strip()
+            with open(os.path.join(index, "level")) as f:
+                level = int(f.read())
+            with open(os.path.join(index, "size")) as f:
+                size = f.read().strip()
+        except (OSError, ValueError):
+            continue
+        if kind != "Instruction":
+            sizes[level] = int(size[:-1]) * SIZE_SUFFIXES[size[-1]] if size[-1] in SIZE_SUFFIXES else int(size)
+    return dict(sorted(sizes.items()))
+
+
+def memory_level(footprint, caches):
+    """Name of the smallest cache of caches ({level: bytes}) that holds footprint bytes, "DRAM" if none does"""
+    return next((f"L{level}" for level, size in caches.items() if footprint <= size), "DRAM")
+
+
+def measure_bandwidths(footprints, repeats=5):
+    """{footprint: B/s}, the triad bandwidth on a working set of every size in footprints"""
+    sizes = sorted(set(footprints))
+    bandwidths = {size: measure_bandwidth(max(size // 24, 1024), repeats) for size in sizes}
+    # numpy's call overhead dominates the triad on the smallest arrays, a smaller working set is still
+    # served at least as fast as a larger one
+    for smaller, larger in zip(reversed(sizes[:-1]), reversed(sizes[1:])):
+        bandwidths[smaller] = max(bandwidths[smaller], bandwidths[larger])
+    return bandwidths
+
+
+def measure_peak_flops(N=2048, repeats=5):
+    """Best BLAS dgemm FLOP/s"""
+    registry = Registry()
+    registry.register("dgemm", "numpy", [N], lambda N: (np.ones((N, N)), 2 * np.ones((N, N)), np.zeros((N, N))),
+                      dgemm_numpy, lambda N: 2 * N**3, "FLOP")
+    result = run(registry.cases, repeats=repeats, verbose=False)[0]
+    return result["work"] / result["min"]
+
+
+def roofline_cases():
+    """
+    The kernels as harness cases with their FLOP count as work, the modelled
+    memory traffic in bytes of one call and the working set in bytes for every
+    (kernel, backend, size). Most run from the caches, diffusion and numpy.fft
+    have a case with a working set larger than the last level cache as well.
+    """
+    registry = Registry()
+    traffic = {}
+    footprints = {}
+
+    def add(kernel, backend, size, setup, fn, flops, nbytes, footprint):
+        registry.register(kernel, backend, [size], setup, fn, lambda _: flops, "FLOP")
+        traffic[(kernel, backend, size)] = nbytes
+        footprints[(kernel, backend, size)] = footprint
+
+    # Julia set, 12 FLOP per iteration of a point: z*z 6, + c 2, abs() 4 (hypot)
+    width, maxiter = 100, 300
+    # the whole grid as one tile
+    _, zs = next(iter_row_tiles(width, width + 1))
+    c = complex(c_real, c_imag)
+    iterations = int(calculate_z_numpy(maxiter, zs, c).sum())
+    points = len(zs)
+    # python: a point (complex object and pointer) is read and its count written once
+    add("julia", "python", width, lambda _: (maxiter, zs, c), calculate_z_serial_purepython,
+        12 * iterations, points * (8 + 32 + 8), points * (8 + 32 + 8))
+    # numpy, per active point and iteration: abs 24 B, < 2 9 B, all() 1 B, compaction of idx and z 50 B,
+    # z*z 32 B, + c 32 B, output[idx] += 1 24 B
+    add("julia", "numpy", width, lambda _: (maxiter, zs, c), calculate_z_numpy, 12 * iterations, 172 * iterations,
+        points * 64)
+    if cython_julia is not None:
+        # |z|^2 < 4 instead of abs(), 11 FLOP per iteration, the point is read (16 B) and its count written once
+        z = np.array(zs)
+        add("julia", "cython", width, lambda _: (maxiter, z, c), cython_julia.calculate_z,
+            11 * iterations, points * (16 + 8), points * (16 + 8))
+
+    # diffusion, 11 FLOP per cell and step
+    steps = 8
+
+    def diffusion_grid(n, backend):
+        if backend == "list":
+            grid = [[0.0] * n for _ in range(n)]
+        else:
+            grid = np.zeros((n, n))
+        set_initial_conditions(grid, (n, n))
+        return grid
+
+    # evolve works on grid_shape
+    n = grid_shape[0]
+    add("diffusion", "list", n, lambda n: (diffusion_grid(n, "list"), 0.1), evolve,
+        11 * n * n, n * n * 2 * PY_FLOAT, n * n * 2 * PY_FLOAT)
+    for n in (grid_shape[0], 2048):
+        # evolve_numpy makes 9 passes over 24 arrays in total, over 5 arrays of the grid's shape
+        add("diffusion", "numpy", n,
+            lambda n: (diffusion_grid(n, "numpy"), np.empty((n, n)), (np.empty((n, n)), np.empty((n, n))), 0.1),
+            evolve_numpy, 11 * n * n, n * n * 24 * 8, n * n * 5 * 8)
+        # evolve_blocked reads every 32 row strip with a halo of steps rows on both sides once and writes it once
+        # per steps steps, the passes of the steps stay in cache
+        add("diffusion", f"blocked ({steps} steps)", n,
+            lambda n: (diffusion_grid(n, "numpy"), np.empty((n, n)), steps, 0.1), evolve_blocked,
+            11 * n * n * steps, n * n * 8 * ((32 + 2 * steps) / 32 + 1), n * n * 2 * 8)
+
+    # Gauss-Seidel, 4 FLOP per interior point and sweep
+    n, sweeps = 64, 10
+    interior = (n - 2)**2 * sweeps
+    # a new float object for every point, the numpy version copies the grid every sweep (16 B) and
+    # reads and writes every point once
+    add("gauss_seidel", "list", n, lambda n: (gauss_seidel_pycollection, grid_list(n), sweeps), run_sweeps,
+        4 * interior, 2 * PY_FLOAT * interior, PY_FLOAT * n * n)
+    add("gauss_seidel", "numpy", n, lambda n: (gauss_seidel, grid_numpy(n), sweeps), run_sweeps,
+        4 * interior, 32 * n * n * sweeps, 16 * n * n)
+    if cython_gs is not None:
+        add("gauss_seidel", "list (cython)", n, lambda n: (cython_gs.gauss_seidel_pycollection, grid_list(n), sweeps),
+            run_sweeps, 4 * interior, 2 * PY_FLOAT * interior, PY_FLOAT * n * n)
+        add("gauss_seidel", "numpy (cython)", n, lambda n: (cython_gs.gauss_seidel, grid_numpy(n), sweeps),
+            run_sweeps, 4 * interior, 32 * n * n * sweeps, 16 * n * n)
+
+    # Game of Life, 8 additions and a division per cell: copy of the grid 16 B, read 8 B, grid[:] = newGrid 16 B
+    n, updates = 64, 2
+    add("game_of_life", "python", n, lambda n: (gosper_grid(n), n, updates), run_updates,
+        9 * n * n * updates, 40 * n * n * updates, 16 * n * n)
+
+    # DFT, 8 FLOP per term (4 multiplications, 4 additions), the input and output lists are read and written
+    # once, FFTs counted as 5 N log2 N FLOP
+    def signal(n):
+        rng = np.random.default_rng(0)
+        return list(rng.standard_normal(n)), list(rng.standard_normal(n)), [0.0] * n, [0.0] * n
+
+    n = 128
+    add("dft", "DFT list", n, signal, DFT, 8 * n * n, 4 * n * PY_FLOAT, 4 * n * PY_FLOAT)
+    n = 512
+    # and the cos and sin tables
+    add("dft", "DFT3 twiddle table", n, signal, DFT3, 8 * n * n, 4 * n * PY_FLOAT, 6 * n * PY_FLOAT)
+
+    def complex_signal(n):
+        return (np.random.default_rng(0).standard_normal(n) + 0j,)
+
+    n = 1 << 16
+    # bit reversal gather 40 B, then per stage t = Y*w 24 B, Y[h:] = Y[:h] - t 24 B, Y[:h] += t 24 B per point,
+    # the signal, Y, t and the twiddles are live
+    add("dft", "dft.fft radix-2", n, complex_signal, fft, 5 * n * 16, n * (40 + 72 * 16), 56 * n)
+    for n in (1 << 16, 1 << 23):
+        add("dft", "numpy.fft.fft", n, complex_signal, np.fft.fft, 5 * n * int(math.log2(n)), 32 * n, 32 * n)
+    return registry, traffic, footprints
+
+
+def _bound(intensity, ridge, fraction, overhead=0.1):
+    # above the roof the kernel moves less data than modelled (or from a faster level), the model says nothing
+    if fraction > 1:
+        return "above roof"
+    # far below the roof neither the memory nor the FPUs are the limit but the interpreter, calls, latencies
+    if fraction < overhead:
+        return "overhead"
+    return "memory" if intensity < ridge else "compute"
+
+
+def roofline(results, traffic, bandwidth, peak, footprints=None, bandwidths=None):
+    """
+    The results placed on the roofline of bandwidth (B/s) and peak (FLOP/s).
+    With the working sets footprints of the kernels and their bandwidths of
+    measure_bandwidths every kernel is placed under the roof of its working set.
+    """
+    caches = cache_sizes()
+    points = []
+    for r in results:
+        key = (r["kernel"], r["backend"], r["size"])
+        nbytes = traffic[key]
+        footprint = footprints.get(key) if footprints else None
+        roof_bandwidth = bandwidths[footprint] if footprint is not None and bandwidths else bandwidth
+        intensity = r["work"] / nbytes
+        measured = 1 / r["bytes_per_flop"] if r.get("bytes_per_flop") else None
+        roof = min(peak, intensity * roof_bandwidth)
+        points.append({"kernel": r["kernel"], "backend": r["backend"], "size": r["size"], "flops": r["work"],
+                       "bytes": nbytes, "footprint": footprint,
+                       "level": memory_level(footprint, caches) if footprint is not None else "DRAM",
+                       "intensity": intensity, "measured_intensity": measured, "gflops": r["throughput"] * 1e-9,
+                       "roof": roof * 1e-9, "fraction": r["throughput"] / roof,
+                       "bound": _bound(intensity, peak / roof_bandwidth, r["throughput"] / roof)})
+    return points
+
+
+def print_roofline(points, bandwidth, peak):
+    print(f"memory bandwidth {bandwidth * 1e-9:.2f} GB/s (numpy triad), peak {peak * 1e-9:.2f} GFLOP/s "
+          f"(BLAS dgemm), ridge point {peak / bandwidth:.2f} FLOP/B")
+    print(f"{'kernel':>14} {'backend':>20} {'size':>7} {'level':>5} {'FLOP/B':>8} {'GFLOP/s':>9} {'roof':>8} "
+          f"{'of roof':>8}  bound")
+    for p in points:
+        measured = f" (measured {p['measured_intensity']:.3g})" if p["measured_intensity"] else ""
+        print(f"{p['kernel']:>14} {p['backend']:>20} {p['size']:>7} {p['level']:>5} {p['intensity']:>8.3g} "
+              f"{p['gflops']:>9.3g} {p['roof']:>8.3g} {100 * p['fraction']:>7.2f}%  {p['bound']}{measured}")
+
+
+def plot_roofline(points, bandwidth, peak, out=None):
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize=(12, 7))
+    intensities = [p["intensity"] for p in points]
+    x = np.logspace(np.log10(min(intensities + [peak / bandwidth]) / 4), np.log10(max(intensities) * 4), 200)
+    ax.plot(x, np.minimum(peak, x * bandwidth) * 1e-9, "k-", label="main memory roofline")
+    # a marker per kernel, a colour per backend, the roof of the kernel's working set as a bar above it
+    markers = dict(zip(dict.fromkeys(p["kernel"] for p in points), "osD^vP*X"))
+    colors = plt.cm.tab20(np.linspace(0, 1, len(points)))
+    for p, color in zip(points, colors):
+        ax.plot(p["intensity"], p["gflops"], markers[p["kernel"]], color=color,
+                label=f"{p['kernel']} {p['backend']} {p['size']} ({p['level']})")
+        ax.plot(p["intensity"], p["roof"], "_", color=color, markersize=14)
+    ax.set_xscale("log")
+    ax.set_yscale("log")
+    ax.set_xlabel("arithmetic intensity (FLOP/byte)")
+    ax.set_ylabel("GFLOP/s")
+    ax.grid(which="both")
+    ax.legend(fontsize="small", loc="upper left", bbox_to_anchor=(1, 1))
+    ax.set_title(f"Roofline, {bandwidth * 1e-9:.1f} GB/s, {peak * 1e-9:.1f} GFLOP/s, bars: roof of the working set")
+    fig.tight_layout()
+    if out is None:
+        plt.show()
+    else:
+        fig.savefig(out)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Roofline of this host with the kernels of the assignments")
+    parser.add_argument("--repeats", type=int, default=5, help="timed samples per kernel")
+    parser.add_argument("--counters", action="store_true", help="also measure the intensity with hardware counters")
+    parser.add_argument("--output", help="CSV file for the roofline points")
+    parser.add_argument("--plot", nargs="?", const="", help="plot the roofline, to this file if given")
+    args = parser.parse_args()
+
+    # the main memory on a working set of at least four times the last level cache
+    bandwidth = measure_bandwidth(max(1 << 24, 4 * max(cache_sizes().values(), default=0) // 24))
+    peak = measure_peak_flops()
+    registry, traffic, footprints = roofline_cases()
+    bandwidths = measure_bandwidths(footprints.values())
+    results = run(registry.cases, repeats=args.repeats, verbose=False, counters=args.counters)
+    points = roofline(results, traffic, bandwidth, peak, footprints, bandwidths)
+    print_roofline(points, bandwidth, peak)
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(points)
+    if args.plot is not None:
+        plot_roofline(points, bandwidth, peak, args.plot or None)
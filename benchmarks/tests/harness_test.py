@@ -0,0 +1,76 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from harness import (Registry, confidence_interval, plot_results, read_results, reject_outliers, run, time_case,
+                     write_results)
+
+
+def test_reject_outliers():
+    samples = [1.0, 1.1, 0.9, 1.0, 1.05, 0.95, 10.0]
+    kept = reject_outliers(samples)
+    assert 10.0 not in kept
+    assert len(kept) == 6
+
+
+def test_confidence_interval():
+    rng = np.random.default_rng(0)
+    samples = rng.normal(1.0, 0.1, 50)
+    low, high = confidence_interval(samples)
+    assert low < samples.mean() < high
+
+
+@pytest.mark.parametrize("extension", [".csv", ".json"])
+def test_results_roundtrip(tmp_path, extension):
+    calls = []
+    registry = Registry()
+    registry.register("sum", "python", [10, 100], lambda n: (list(range(n)),), lambda x: calls.append(sum(x)),
+                      lambda n: n, "FLOP")
+    registry.register("sum", "numpy", [10, 100], lambda n: (np.arange(n),), np.sum)
+    cases = registry.select(backends=["python"])
+    results = run(cases, warmup=1, repeats=3, verbose=False, granularity=1, min_multiple=0)
+    assert len(calls) == 2 * (1 + 3)
+    path = str(tmp_path / ("results" + extension))
+    write_results(results, path)
+    loaded = read_results(path)
+    assert [(r["kernel"], r["backend"], r["size"]) for r in loaded] == [("sum", "python", 10), ("sum", "python", 100)]
+    assert loaded[1]["work"] == 100
+    assert loaded[0]["ci_low"] <= loaded[0]["mean"] <= loaded[0]["ci_high"]
+    np.testing.assert_allclose(loaded[1]["throughput"], results[1]["throughput"])
+
+
+def test_inner_calls():
+    # a call far below the requested sample length is repeated within a sample
+    registry = Registry()
+    registry.register("noop", "python", [1], lambda n: (), lambda: None)
+    samples, inner, noisy = time_case(registry.cases[0], warmup=0, repeats=3, min_time=1_000_000)
+    assert inner > 1
+    assert not noisy
+    assert len(samples) == 3 and max(samples) < 1e-3
+    # with the inner calls capped the samples stay too short
+    _, inner, noisy = time_case(registry.cases[0], warmup=0, repeats=3, min_time=1_000_000_000, max_inner=4)
+    assert inner == 4
+    assert noisy
+
+
+def test_plot_results(tmp_path):
+    pytest.importorskip("matplotlib")
+    import matplotlib
+    matplotlib.use("Agg")
+    registry = Registry()
+    registry.register("sum", "numpy", [10, 100], lambda n: (np.arange(n),), np.sum, lambda n: n, "FLOP")
+    results = run(registry.cases, warmup=0, repeats=3, verbose=False, granularity=1, min_multiple=0)
+    # two scripts with the same kernels write to different files
+    plot_results(results, "throughput", str(tmp_path), name="stream_{kernel}_cython", peak=5e9)
+    assert os.listdir(tmp_path) == ["stream_sum_cython.pdf"]
+
+
+def test_warmup_calibration():
+    # a call longer than the target needs no calibration sample besides the warm-up one
+    calls = []
+    registry = Registry()
+    registry.register("append", "python", [1], lambda n: (), lambda: calls.append(1))
+    samples, inner, _ = time_case(registry.cases[0], warmup=1, repeats=3, min_time=1)
+    assert inner == 1 and len(calls) == 1 + 3
@@ -0,0 +1,63 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from harness import Registry, _counts_per_call, run, time_case
+from perf_counters import PerfCounters, derived_metrics
+
+# software events work without a hardware PMU (e.g. in a VM)
+SOFTWARE_EVENTS = {"task_clock": (1, 1), "context_switches": (1, 3)}
+
+
+def test_counters_accumulate_timed_samples():
+    counters = PerfCounters(SOFTWARE_EVENTS)
+    if not counters.available:
+        pytest.skip(counters.reason)
+    registry = Registry()
+    registry.register("ones", "numpy", [1 << 20], lambda n: (n,), np.ones)
+    time_case(registry.cases[0], warmup=1, repeats=3, counters=counters)
+    counts = counters.read()
+    counters.close()
+    assert counts["task_clock"] > 0
+    assert counts["context_switches"] >= 0
+
+
+def test_unavailable_counters_fall_back():
+    counters = PerfCounters({"bogus": (1 << 30, 0)})
+    assert not counters.available and counters.reason
+    with counters:
+        pass
+    assert counters.read() == {"bogus": None}
+    registry = Registry()
+    registry.register("sum", "numpy", [10], lambda n: (np.arange(n),), np.sum)
+    result = run(registry.cases, repeats=3, verbose=False, counters=True)[0]
+    assert result["mean"] > 0
+    assert "ipc" in result
+
+
+def test_other_threads_drop_counts():
+    counters = PerfCounters(SOFTWARE_EVENTS)
+    if not counters.available:
+        pytest.skip(counters.reason)
+    registry = Registry()
+    registry.register("ones", "numpy", [1 << 20], lambda n: (n,), np.ones)
+    with counters:
+        np.ones(1 << 20)
+    assert counters.other_threads < 0.5
+    assert _counts_per_call(counters, registry.cases[0], 1)["task_clock"] > 0
+    counters.reset()
+    with ThreadPoolExecutor(1) as pool, counters:
+        pool.submit(sum, range(3 * 10**6)).result()
+    counters.close()
+    assert counters.other_threads > 0.5
+    assert _counts_per_call(counters, registry.cases[0], 1) is None
+
+
+def test_derived_metrics():
+    metrics = derived_metrics({"cycles": 100.0, "instructions": 250.0, "llc_misses": 10.0}, flops=320)
+    assert metrics["ipc"] == 2.5
+    assert metrics["bytes_per_flop"] == 2.0
+    assert derived_metrics(dict.fromkeys(("cycles", "instructions", "llc_misses"))) == {"ipc": None, "bytes_per_flop": None}
@@ -0,0 +1,36 @@
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from harness import Registry, run
+from results_db import compare_runs, connect, store_run
+
+
+def fake_results(scale, rng):
+    samples = rng.normal(1.0, 0.01, 20) * scale
+    return [{"kernel": "k", "backend": "b", "size": 10, "repeats": 20, "mean": samples.mean(), "std": samples.std(),
+             "median": np.median(samples), "ci_low": samples.mean() - 0.01, "ci_high": samples.mean() + 0.01,
+             "work": None, "unit": None, "throughput": None, "samples": samples}]
+
+
+def test_compare_runs():
+    rng = np.random.default_rng(0)
+    db = connect(":memory:")
+    base = store_run(db, fake_results(1.0, rng))
+    same = store_run(db, fake_results(1.0, rng))
+    slower = store_run(db, fake_results(1.2, rng))
+    assert [c["status"] for c in compare_runs(db, base, same)] == ["ok"]
+    assert [c["status"] for c in compare_runs(db, base, slower)] == ["REGRESSION"]
+    assert [c["status"] for c in compare_runs(db, slower, base)] == ["improvement"]
+
+
+def test_store_harness_run():
+    registry = Registry()
+    registry.register("sum", "numpy", [10, 100], lambda n: (np.arange(n),), np.sum)
+    results = run(registry.cases, repeats=5, verbose=False)
+    db = connect(":memory:")
+    run_id = store_run(db, results, label="test")
+    row = db.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+    assert row["label"] == "test" and row["cores"] >= 1
+    assert db.execute("SELECT COUNT(*) FROM results WHERE run_id = ?", (run_id,)).fetchone()[0] == 2
@@ -0,0 +1,37 @@
+import os
+import sys
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from roofline import roofline
+
+
+def result(backend, flops, seconds):
+    return {"kernel": "k", "backend": backend, "size": 1, "work": flops, "throughput": flops / seconds}
+
+
+def test_roofline():
+    # 10 GB/s and 100 GFLOP/s, ridge point at 10 FLOP/B
+    bandwidth, peak = 10e9, 100e9
+    traffic = {("k", "stream", 1): 8e9, ("k", "gemm", 1): 1e9, ("k", "python", 1): 1e9}
+    results = [result("stream", 1e9, 1.0), result("gemm", 1e11, 2.0), result("python", 1e9, 10.0)]
+    stream, gemm, python = roofline(results, traffic, bandwidth, peak)
+    assert stream["intensity"] == 0.125 and stream["bound"] == "memory"
+    assert stream["roof"] == pytest.approx(1.25)
+    assert stream["fraction"] == pytest.approx(0.8)
+    assert gemm["intensity"] == 100 and gemm["roof"] == pytest.approx(100) and gemm["bound"] == "compute"
+    # 0.1 GFLOP/s under a roof of 10 GFLOP/s
+    assert python["bound"] == "overhead"
+
+
+def test_roofline_working_set():
+    # the same kernel from the caches (1 kB working set) and from the main memory (1 GB)
+    bandwidth, peak = 10e9, 100e9
+    traffic = {("k", "small", 1): 1e9, ("k", "large", 2): 1e9}
+    footprints = {("k", "small", 1): 1e3, ("k", "large", 2): 1e9}
+    bandwidths = {1e3: 40e9, 1e9: 10e9}
+    results = [dict(result("small", 1e8, 0.05), size=1), dict(result("large", 1e8, 0.05), size=2)]
+    small, large = roofline(results, traffic, bandwidth, peak, footprints, bandwidths)
+    # 2 GFLOP/s at 0.1 FLOP/B, under the 4 GFLOP/s cache roof but above the 1 GFLOP/s memory roof
+    assert small["roof"] == pytest.approx(4) and small["bound"] == "memory"
+    assert large["roof"] == pytest.approx(1) and large["bound"] == "above roof"
@@ -6,11 +6,12 @@ Game of life code fetched from: https://www.geeksforgeeks.org/conways-game-life-
 
 # Python code to implement Conway's Game Of Life
 import argparse
+import os
+import sys
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib import rcParams
-import matplotlib.animation as animation
-from time import perf_counter_ns as timer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+from harness import Registry, make_parser, main as run_benchmarks
 
 
 
@@ -150,41 +151,25 @@ def main():
     # plt.show()
 
 
-# call main
-if __name__ == '__main__':
-    n_iter = 100
-
-    grid_sizes = [64, 128, 256, 512, 1024]
-    exec_times = []
-    for N in grid_sizes:
-        print(N)
-        t0 = timer()
-        grid = np.zeros(N * N).reshape(N, N)
-        addGosperGliderGun(10, 10, grid)
-        for i in range(n_iter):
-            update(grid, N)
-        t1 = timer() - t0
-        exec_times.append(t1)
-
-    rcParams.update({'font.size': 20})
-    fig, ax = plt.subplots(figsize=(16, 10))
-    ax.set_xlabel("Container size")
-    ax.set_ylabel("Execution time (s)")
-
-    ax.plot(grid_sizes, exec_times, "o:", label='Game Of life Execution Times', linewidth=2.0)
-    ax.legend()
-
-    #ax.set(yscale="log")
-    plt.grid(True, which="both")
-    ax.set_xticks(N, minor=False)
-    fig.suptitle("DFT execution times")
-    fig.tight_layout()
-
-
-    plt.show()
-
-
+def gosper_grid(N):
+    grid = np.zeros(N * N).reshape(N, N)
+    addGosperGliderGun(10, 10, grid)
+    return grid
 
 
+def run_updates(grid, N, n_iter):
+    for i in range(n_iter):
+        update(grid, N)
 
 
+# call main
+if __name__ == '__main__':
+    grid_sizes = [64, 128, 256, 512, 1024]
+    parser = make_parser("Game of Life benchmark", "game_of_life_results.csv")
+    parser.add_argument("--iterations", type=int, default=100, help="updates per run")
+    args = parser.parse_args()
+    registry = Registry()
+    registry.register("game_of_life", "python", grid_sizes, lambda N: (gosper_grid(N), N, args.iterations),
+                      run_updates)
+    run_benchmarks(registry, args)
+    # execution time figure: python ../benchmarks/harness.py plot game_of_life_results.csv --linear